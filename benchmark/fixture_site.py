@@ -0,0 +1,204 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from string import Template
+from urllib.parse import urlsplit, parse_qs, urlencode
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+TITLES = ["Data Scientist", "Senior Data Analyst", "Machine Learning Engineer",
+          "Data Engineer", "Software Engineer", "Analytics Engineer"]
+COMPANIES = ["Acme Analytics", "Globex", "Initech", "Umbrella Health", "Stark Industries",
+             "Wayne Financial", "Hooli", "Vandelay Imports"]
+LOCATIONS = ["Charlotte, NC", "Remote", "Raleigh, NC", "New York, NY"]
+SENIORITY = ["Entry level", "Associate", "Mid-Senior level", "Director"]
+EMPLOYMENT = ["Full-time", "Contract", "Part-time"]
+INDUSTRIES = ["Software Development", "Financial Services", "Hospitals and Health Care"]
+SENTENCES = [
+    "You will partner with product and engineering to ship data driven features.",
+    "Experience with Python, SQL and cloud data warehouses is required.",
+    "Build and maintain pipelines that feed our reporting and machine learning models.",
+    "Design experiments, analyze results and present findings to leadership.",
+    "We offer competitive pay, equity and a flexible remote friendly culture.",
+    "Familiarity with Spark, Airflow or dbt is a plus.",
+    "Mentor junior team members and contribute to our engineering standards."
+]
+
+
+def load_template(name):
+    """Load one of the recorded page templates."""
+    with open(os.path.join(FIXTURE_DIR, name), "r", encoding="utf-8") as file:
+        return Template(file.read())
+
+
+def slugify(text):
+    return "-".join(text.lower().replace(",", "").split())
+
+
+class FixtureSite:
+    """
+    Local HTTP server replaying recorded LinkedIn and Dice DOM structures with any
+    number of generated postings, so scrapers can be benchmarked without the internet.
+    """
+
+    def __init__(self, port=0, latency_ms=0, authwall_every=0, page_delay_ms=100,
+                 description_sentences=40):
+        """
+        :param port: Port to listen on, 0 picks a free one.
+        :param latency_ms: Delay added to every response to mimic the network.
+        :param authwall_every: Serve LinkedIn's "Join LinkedIn" wall on every n-th posting.
+        :param page_delay_ms: Delay before scrolled or paginated results are rendered.
+        :param description_sentences: Sentences in each generated job description.
+        """
+        self.latency_ms = latency_ms
+        self.authwall_every = authwall_every
+        self.page_delay_ms = page_delay_ms
+        self.description_sentences = description_sentences
+
+        self.templates = {name[:-5]: load_template(name) for name in os.listdir(FIXTURE_DIR)
+                          if name.endswith(".html")}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def linkedin_landing_url(self, keywords, postings=50, sign_in_modal=True):
+        query = urlencode({"keywords": keywords, "n": postings, "modal": int(sign_in_modal)})
+        return "{}/jobs/search/?{}".format(self.base_url, query)
+
+    def dice_landing_url(self, keywords, postings=50, per_page=20):
+        query = urlencode({"q": keywords, "n": postings, "per_page": per_page})
+        return "{}/jobs?{}".format(self.base_url, query)
+
+    def _posting(self, seed):
+        """Deterministic fake posting for a seed."""
+        rng = random.Random(seed)
+        title = rng.choice(TITLES)
+        company = rng.choice(COMPANIES)
+        paragraphs = ["<p>{}</p>".format(" ".join(rng.choice(SENTENCES) for _ in range(5)))
+                      for _ in range(max(self.description_sentences // 5, 1))]
+        return {"title": title, "slug": slugify(title + " at " + company),
+                "company": company, "company_slug": slugify(company),
+                "location": rng.choice(LOCATIONS), "seniority": rng.choice(SENIORITY),
+                "employment_type": rng.choice(EMPLOYMENT), "industry": rng.choice(INDUSTRIES),
+                "description": "\n".join(paragraphs), "base_url": self.base_url}
+
+    def _linkedin_ids(self, keywords, postings):
+        start = 3000000000 + zlib.crc32(keywords.encode("utf-8")) % 100000 * 10000
+        return [start + idx for idx in range(postings)]
+
+    def _dice_ids(self, keywords, postings):
+        return [str(uuid.uuid5(uuid.NAMESPACE_URL, "{}-{}".format(keywords, idx)))
+                for idx in range(postings)]
+
+    def linkedin_landing(self, query):
+        keywords = query.get("keywords", ["data"])[0]
+        postings = int(query.get("n", [50])[0])
+
+        cards = []
+        for position, posting_id in enumerate(self._linkedin_ids(keywords, postings), 1):
+            posting = self._posting(posting_id)
+            cards.append(self.templates["linkedin_card"].substitute(
+                posting, posting_id=posting_id, position=position))
+
+        # The first batch is in the page, the rest arrive when the list is scrolled
+        modal = self.templates["linkedin_sign_in_modal"].template \
+            if query.get("modal", ["1"])[0] == "1" else ""
+        return self.templates["linkedin_landing"].substitute(
+            keywords=keywords, cards="".join(cards[:25]), more_cards=json.dumps(cards[25:]),
+            sign_in_modal=modal, scroll_delay_ms=self.page_delay_ms)
+
+    def linkedin_detail(self, path):
+        posting_id = int(path.rsplit("-", 1)[1])
+        if self.authwall_every and posting_id % self.authwall_every == 0:
+            return self.templates["linkedin_authwall"].template
+        return self.templates["linkedin_detail"].substitute(self._posting(posting_id))
+
+    def dice_landing(self, query):
+        keywords = query.get("q", ["data"])[0]
+        postings = int(query.get("n", [50])[0])
+        per_page = int(query.get("per_page", [20])[0])
+
+        cards = [self.templates["dice_card"].substitute(self._posting(posting_id),
+                                                         posting_id=posting_id)
+                 for posting_id in self._dice_ids(keywords, postings)]
+        pages = [cards[idx:idx + per_page] for idx in range(0, len(cards), per_page)] or [[]]
+
+        return self.templates["dice_landing"].substitute(
+            keywords=keywords, pages=json.dumps(pages), first_page="".join(pages[0]),
+            next_disabled=' aria-disabled="true"' if len(pages) == 1 else "",
+            page_delay_ms=self.page_delay_ms)
+
+    def dice_detail(self, path):
+        posting_id = path.rsplit("/", 1)[1]
+        return self.templates["dice_detail"].substitute(self._posting(posting_id))
+
+    def handle(self, request):
+        parts = urlsplit(request.path)
+        query = parse_qs(parts.query)
+
+        if parts.path.startswith("/jobs/search"):
+            route, body = "linkedin_landing", self.linkedin_landing(query)
+        elif parts.path.startswith("/jobs/view/"):
+            route, body = "linkedin_detail", self.linkedin_detail(parts.path.rstrip("/"))
+        elif parts.path == "/jobs":
+            route, body = "dice_landing", self.dice_landing(query)
+        elif parts.path.startswith("/job-detail/"):
+            route, body = "dice_detail", self.dice_detail(parts.path.rstrip("/"))
+        else:
+            route, body = "not_found", None
+
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        if body is None:
+            request.send_response(404)
+            request.end_headers()
+            return
+
+        payload = body.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+if __name__ == '__main__':
+    site = FixtureSite(port=8765).start()
+    print("Serving fixtures at", site.linkedin_landing_url("data scientist"),
+          "and", site.dice_landing_url("data science"))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        site.stop()
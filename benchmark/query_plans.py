@@ -0,0 +1,226 @@
+"""
+Check that the hot job_postings queries use our indexes instead of scanning the table,
+against a synthetic database with a realistic amount of history.
+
+Run from the repository root, e.g.
+    python -m benchmark.query_plans --rows 1000000
+Exits with status 1 if any query's plan regressed.
+"""
+from model.DataBaseHandler import DataBaseHandler
+from model.descriptions import description_hash
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# The DataBaseHandler calls behind the hot queries, with the index their plans must use.
+# Each call's statements are captured as they run, so the plans checked are the real ones.
+HOT_QUERIES = {
+    "fetch_recent_jobs": (
+        lambda db_handler: db_handler.fetch_recent_jobs(days=1),
+        "job_postings_insert_timestamp"),
+    "fetch_recent_posting_keys": (
+        lambda db_handler: list(db_handler.fetch_recent_posting_keys(days=1)),
+        "COVERING INDEX job_postings_insert_timestamp"),
+    "fetch_unprocessed_jobs": (
+        lambda db_handler: db_handler.fetch_unprocessed_jobs(),
+        "job_postings_unevaluated"),
+    "reuse_agent_results": (
+        lambda db_handler: db_handler.reuse_agent_results(),
+        "COVERING INDEX job_postings_evaluated_description_hash"),
+    "insert_jobs": (
+        lambda db_handler: db_handler.insert_jobs([SYNTHETIC_JOB]),
+        "INDEX sqlite_autoindex_job_descriptions_1"),
+    "fetch_jobs_page": (
+        lambda db_handler: db_handler.fetch_jobs_page(after_id=db_handler.change_token() // 2,
+                                                      limit=1000),
+        "INTEGER PRIMARY KEY"),
+    "fetch_jobs_page updated_since": (
+        lambda db_handler: db_handler.fetch_jobs_page(limit=1000, updated_since="2099-01-01"),
+        "INDEX job_postings_updated_at"),
+    "changes_since": (
+        lambda db_handler: db_handler.changes_since(db_handler.change_token() - 1000,
+                                                    ["id", "posting_url"], 10000),
+        "INDEX job_postings_row_version"),
+    "fetch_expired_job_ids": (
+        lambda db_handler: db_handler.fetch_expired_job_ids(days=180),
+        "INDEX job_postings_insert_timestamp"),
+    "update_agent_responses": (
+        lambda db_handler: db_handler.update_agent_responses(
+            {"id": [10], "agent_response": [{QUESTIONS[0]: {"response": "No"}}]}),
+        "INTEGER PRIMARY KEY"),
+    "fetch_job_ids_with_response": (
+        lambda db_handler: db_handler.fetch_job_ids_with_response(QUESTIONS[1], "Yes"),
+        "COVERING INDEX agent_results_question_response"),
+    "search_job_ids": (
+        lambda db_handler: db_handler.search_job_ids("synth", column="description"),
+        "VIRTUAL TABLE INDEX"),
+    # Deletes rows, so it goes last
+    "delete_jobs": (
+        lambda db_handler: db_handler.delete_jobs(
+            db_handler.fetch_expired_job_ids(days=180, limit=100)),
+        "COVERING INDEX job_postings_evaluated_description_hash"),
+}
+
+# Statements worth a plan, the rest are transaction control and pragmas
+PLANNED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Questions every synthetic posting the agent processed has an answer for
+QUESTIONS = ["Is this company on the black list?", "Is this posting legitimate?"]
+
+# Posting stored by the insert_jobs check
+SYNTHETIC_JOB = {"posting_url": "https://example.com/jobs/view/new", "posting_id": "posting-new",
+                 "job_title": "Data Scientist", "description": "Synthetic description new",
+                 "experience": None, "employment_type": None, "industries": None}
+
+
+def fill_job_postings(db_handler, rows, unprocessed_rate=0.01, days=730, batch=50000):
+    """Insert synthetic postings spread over the last 'days' days."""
+    conn = db_handler.get_connection()
+    rng = random.Random(0)
+    now = time.time()
+
+    for start in range(0, rows, batch):
+        postings, answers = [], []
+        for idx in range(start, min(start + batch, rows)):
+            inserted = time.strftime("%Y-%m-%d %H:%M:%S",
+                                     time.gmtime(now - rng.random() * days * 86400))
+            processed = rng.random() >= unprocessed_rate
+            description = "Synthetic description {}".format(idx)
+            postings.append((idx + 1, "https://example.com/jobs/view/{}".format(idx),
+                             "posting-{}".format(idx), "Data Scientist", description,
+                             description_hash(description), inserted,
+                             inserted if processed else None))
+            if processed:
+                answers.extend((idx + 1, question, rng.choice(["Yes", "No"]), "Synthetic")
+                               for question in QUESTIONS)
+
+        conn.executemany("""
+            INSERT INTO job_postings (id, posting_url, posting_id, job_title, description,
+                                      description_hash, insert_timestamp, evaluated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, postings)
+        conn.executemany("""
+            INSERT INTO agent_results (job_id, question, response, explanation)
+            VALUES (?, ?, ?, ?)
+        """, answers)
+        conn.commit()
+
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def query_plan(conn, query):
+    """The EXPLAIN QUERY PLAN details of a query, one line per step."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+
+
+def captured_statements(db_handler, call):
+    """
+    Run a DataBaseHandler call and collect the statements it ran, on this thread's
+    connection and on the writer's, with their parameters filled in.
+    """
+    statements = []
+    reader = db_handler.get_connection()
+    reader.set_trace_callback(statements.append)
+    db_handler.writer.execute([lambda conn: conn.set_trace_callback(statements.append)])
+    try:
+        call(db_handler)
+    finally:
+        reader.set_trace_callback(None)
+        db_handler.writer.execute([lambda conn: conn.set_trace_callback(None)])
+
+    return [statement for statement in statements
+            if statement.lstrip().upper().startswith(PLANNED_STATEMENTS)]
+
+
+def partial_indexes(conn):
+    """Names of the indexes with a WHERE clause."""
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '%WHERE%'")]
+
+
+def small_tables(conn, rows=100):
+    """
+    Names of the tables holding at most 'rows' rows, like the change_versions counter or
+    the full text index's config, which the triggers and FTS5 read whole.
+    """
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%'")]
+    return [name for name in tables if conn.execute(
+        'SELECT COUNT(*) FROM (SELECT 1 FROM "{}" LIMIT ?)'.format(name),
+        (rows + 1,)).fetchone()[0] <= rows]
+
+
+def full_scans(conn, plan):
+    """
+    Steps of a plan that read a whole table or index. Scanning a partial index only
+    reads the rows it was made for, and table valued functions like json_each only
+    hold their arguments.
+    """
+    partial = partial_indexes(conn)
+    small = small_tables(conn)
+    small += ["main." + name for name in small]
+
+    scans = []
+    for step in plan:
+        if not step.startswith("SCAN ") or "VIRTUAL TABLE" in step \
+                or "CONSTANT ROW" in step or step.split()[1] in small:
+            continue
+        index = step.split(" USING INDEX ")[-1].split()[0] if " USING INDEX " in step \
+            else None
+        if index not in partial:
+            scans.append(step)
+    return scans
+
+
+def check_query_plan(db_handler, name):
+    """
+    Check the plans of one hot query's statements.
+    :return: Plan of every statement it ran, and whether they used the expected index
+        without a full scan.
+    """
+    call, expected = HOT_QUERIES[name]
+    conn = db_handler.get_connection()
+    # Statements run once per row plan the same way, each step is kept once
+    plan = list(dict.fromkeys(step for statement in captured_statements(db_handler, call)
+                              for step in query_plan(conn, statement)))
+    uses_index = any(expected in step for step in plan)
+    return plan, uses_index and not full_scans(conn, plan)
+
+
+def check_query_plans(db_handler):
+    """
+    Check every hot query's plan.
+    :return: Query name -> (plan, whether it used its index without a full scan).
+    """
+    return {name: check_query_plan(db_handler, name) for name in HOT_QUERIES}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check job_postings query plans.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="query-plans-")
+    try:
+        db_handler = DataBaseHandler(os.path.join(temp_dir, "plans.db"))
+
+        start = time.perf_counter()
+        fill_job_postings(db_handler, args.rows)
+        print("Inserted {} synthetic postings in {:.1f}s".format(
+            args.rows, time.perf_counter() - start))
+
+        failed = False
+        for name, (plan, ok) in check_query_plans(db_handler).items():
+            print("{} {}: {}".format("ok  " if ok else "FAIL", name, " | ".join(plan)))
+            failed = failed or not ok
+
+        db_handler.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,47 @@
+"""
+Time a retention run on a synthetic database with two years of history: how long archiving
+the expired postings takes, the space it hands back and how much faster a full read gets.
+
+Run from the repository root, e.g.
+    python -m benchmark.retention --rows 1000000 --days 180
+"""
+from benchmark.query_plans import fill_job_postings
+from benchmark.snapshot_export import timed
+from model.DataBaseHandler import DataBaseHandler
+import argparse
+import os
+import shutil
+import tempfile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time archiving expired job postings.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=180,
+                        help="Postings inserted longer ago than this are archived.")
+    parser.add_argument("--vacuum-pages", type=int, default=0,
+                        help="Most free pages to hand back, 0 for all of them.")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="retention-")
+    try:
+        db_handler = DataBaseHandler(os.path.join(temp_dir, "retention.db"))
+
+        _, seconds = timed(fill_job_postings, db_handler, args.rows)
+        print("Inserted {} synthetic postings in {:.1f}s".format(args.rows, seconds))
+
+        report, seconds = timed(db_handler.apply_retention, days=args.days,
+                                archive_path=os.path.join(temp_dir, "job_archive.db"),
+                                vacuum_pages=args.vacuum_pages, measure=True)
+        print("Archived {} postings in {:.1f}s".format(report["archived"], seconds))
+        print("Database: {:.1f} MB, {:.1f} MB freed, {:.1f} MB still free".format(
+            report["file_bytes"] / 2 ** 20, report["freed_bytes"] / 2 ** 20,
+            report["free_bytes"] / 2 ** 20))
+        print("Archive: {:.1f} MB".format(report["archive_bytes"] / 2 ** 20))
+        if "read_seconds_after" in report:
+            print("fetch_all_jobs: {:.2f}s before, {:.2f}s after".format(
+                report["read_seconds_before"], report["read_seconds_after"]))
+
+        db_handler.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,183 @@
+"""
+Benchmark the scrapers end to end against the local fixture site.
+
+Run from the repository root, e.g.
+    python -m benchmark.run_benchmark --scraper LinkedInScraper --postings 100 --workers 2
+"""
+from benchmark.fixture_site import FixtureSite
+from model.DataBaseHandler import DataBaseHandler
+from model.driver_pool import get_driver_pool
+from model.process_stats import process_tree_rss_mb
+from model.scraper import LinkedInScraper, DiceScraper
+from model.seen_index import SeenPostingsIndex
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Scraper methods timed as benchmark phases
+PHASES = ["navigate_landing_page", "extract_jobs_list", "extract_job_information",
+          "extract_jobs_http", "parse_job_html"]
+
+
+class PhaseTimer:
+    """Thread safe accumulator of how long each phase took."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+
+    def record(self, phase, seconds):
+        with self.lock:
+            self.timings.setdefault(phase, []).append(seconds)
+
+    def summary(self):
+        with self.lock:
+            return {phase: {"count": len(seconds), "total_seconds": sum(seconds),
+                            "mean_seconds": sum(seconds) / len(seconds)}
+                    for phase, seconds in self.timings.items()}
+
+
+def timed_scraper_class(scraper_class, timer):
+    """Subclass a scraper so that every phase method reports its duration."""
+
+    def wrap(name):
+        method = getattr(scraper_class, name)
+
+        def timed(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                timer.record(name, time.perf_counter() - start)
+
+        return timed
+
+    return type("Benchmark" + scraper_class.__name__, (scraper_class,),
+                {name: wrap(name) for name in PHASES})
+
+
+class MemorySampler:
+    """Sample the RSS of this process and every browser it launched in the background."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak_mb = max(self.peak_mb, process_tree_rss_mb(os.getpid()))
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.peak_mb
+
+
+def run_benchmark(scraper_name, postings=50, landing_pages=2, detail_mode="selenium",
+                  workers=1, latency_ms=0, authwall_every=0, per_page=20):
+    """
+    Scrape fixture landing pages with a scraper class and measure how it performed.
+    :param scraper_name: LinkedInScraper or DiceScraper.
+    :param postings: Postings listed on each landing page.
+    :param landing_pages: Number of landing pages to scrape.
+    :param detail_mode: DetailFetchMode to use, selenium or http.
+    :param workers: Detail workers (and pooled drivers).
+    :param latency_ms: Latency added by the fixture server to every response.
+    :param authwall_every: Serve LinkedIn's auth wall on every n-th posting.
+    :param per_page: Dice results per page.
+    """
+    site = FixtureSite(latency_ms=latency_ms, authwall_every=authwall_every).start()
+    temp_dir = tempfile.mkdtemp(prefix="scraper-benchmark-")
+    timer = PhaseTimer()
+
+    if scraper_name == "LinkedInScraper":
+        urls = [site.linkedin_landing_url("keywords {}".format(idx), postings)
+                for idx in range(landing_pages)]
+        scraper_class = LinkedInScraper
+    else:
+        urls = [site.dice_landing_url("keywords {}".format(idx), postings, per_page)
+                for idx in range(landing_pages)]
+        scraper_class = DiceScraper
+
+    config = {"LandingPages": urls,
+              "DetailFetchMode": detail_mode,
+              "DetailWorkers": workers,
+              "DriverPool": {"size": workers},
+              # The fixture site never throttles, so don't let the limiter hold us back
+              "RateLimit": {"rate": 1000, "max_rate": 1000, "burst": 1000,
+                            "concurrency": workers, "max_concurrency": workers},
+              "Readiness": {"timeout": 10, "fallback_sleep": 3, "load_more_timeout": 3,
+                            "popup_timeout": 3}}
+
+    db_handler = DataBaseHandler(os.path.join(temp_dir, "benchmark.db"))
+    sampler = MemorySampler().start()
+    benchmark_class = timed_scraper_class(scraper_class, timer)
+
+    try:
+        start = time.perf_counter()
+        scraper = benchmark_class(db_handler, config, seen_index=SeenPostingsIndex(db_handler))
+        startup_seconds = time.perf_counter() - start
+
+        try:
+            job_count = scraper.parse_all_searches()
+        finally:
+            scraper.close()
+        elapsed = time.perf_counter() - start
+
+    finally:
+        peak_mb = sampler.stop()
+        get_driver_pool(benchmark_class.__name__).close()
+        site.stop()
+
+    stored = sum(1 for description, in db_handler.iter_jobs(["description"])
+                 if description is not None)
+    db_handler.close()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    pages = sum(count for route, count in site.requests.items() if route != "not_found")
+
+    return {"scraper": scraper_name,
+            "detail_mode": detail_mode,
+            "workers": workers,
+            "postings": job_count,
+            "postings_stored": stored,
+            "pages_served": site.requests,
+            "elapsed_seconds": elapsed,
+            "startup_seconds": startup_seconds,
+            "postings_per_second": job_count / elapsed if elapsed else 0,
+            "pages_per_second": pages / elapsed if elapsed else 0,
+            "peak_rss_mb": peak_mb,
+            "phases": timer.summary(),
+            "readiness": scraper.readiness.summary()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark scrapers against local fixtures.")
+    parser.add_argument("--scraper", default="all",
+                        choices=["all", "LinkedInScraper", "DiceScraper"])
+    parser.add_argument("--postings", type=int, default=50)
+    parser.add_argument("--landing-pages", type=int, default=2)
+    parser.add_argument("--detail-mode", default="selenium", choices=["selenium", "http"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--authwall-every", type=int, default=0)
+    args = parser.parse_args()
+
+    scraper_names = ["LinkedInScraper", "DiceScraper"] if args.scraper == "all" \
+        else [args.scraper]
+
+    for name in scraper_names:
+        result = run_benchmark(name, postings=args.postings, landing_pages=args.landing_pages,
+                               detail_mode=args.detail_mode, workers=args.workers,
+                               latency_ms=args.latency_ms, authwall_every=args.authwall_every)
+        print(json.dumps(result, indent=2))
@@ -0,0 +1,67 @@
+"""
+Time the Parquet snapshot of job_postings against loading the table from SQLite, on a
+synthetic database with a realistic amount of history.
+
+Run from the repository root, e.g.
+    python -m benchmark.snapshot_export --rows 1000000
+"""
+from benchmark.query_plans import fill_job_postings
+from model.DataBaseHandler import DataBaseHandler
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+def timed(function, *args, **kwargs):
+    """Run a function, returning its result and the seconds it took."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time job_postings snapshot export and reads.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--updates", type=int, default=1000,
+                        help="Postings changed before the incremental export.")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="snapshot-export-")
+    try:
+        db_handler = DataBaseHandler(os.path.join(temp_dir, "snapshot.db"))
+        snapshot_dir = os.path.join(temp_dir, "job_snapshot")
+
+        _, seconds = timed(fill_job_postings, db_handler, args.rows)
+        print("Inserted {} synthetic postings in {:.1f}s".format(args.rows, seconds))
+
+        exported, seconds = timed(db_handler.export_snapshot, snapshot_dir)
+        print("Full export: {} postings in {:.2f}s".format(exported, seconds))
+
+        db_handler.update_applied_status([(job_id, True) for job_id in
+                                          range(1, args.rows + 1, max(args.rows // args.updates, 1))])
+        exported, seconds = timed(db_handler.export_snapshot, snapshot_dir)
+        print("Incremental export: {} postings in {:.2f}s".format(exported, seconds))
+
+        deleted = db_handler.delete_jobs(range(2, args.rows + 1,
+                                               max(args.rows // args.updates, 1)))[0]
+        exported, seconds = timed(db_handler.export_snapshot, snapshot_dir)
+        print("Export after {} deletions: {} postings in {:.2f}s".format(
+            deleted, exported, seconds))
+
+        data, seconds = timed(db_handler.fetch_all_jobs)
+        print("fetch_all_jobs: {} postings in {:.2f}s".format(len(data), seconds))
+
+        data, seconds = timed(db_handler.fetch_jobs_snapshot, snapshot_dir=snapshot_dir)
+        print("fetch_jobs_snapshot: {} postings in {:.2f}s".format(len(data), seconds))
+
+        data, seconds = timed(db_handler.fetch_jobs_snapshot,
+                              ["id", "job_title", "applied", "insert_timestamp"],
+                              snapshot_dir=snapshot_dir)
+        print("fetch_jobs_snapshot, dashboard columns: {} postings in {:.2f}s".format(
+            len(data), seconds))
+
+        db_handler.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -25,6 +25,7 @@ class Agent:
         inference_method = self.config['InferenceMethod']
 
         print(self.config[inference_method])
+        self.model_name = self.config[inference_method].get('model_name', inference_method)
         # This can take a while to load if in device mode
         self.agent_inference = eval(inference_method)(**self.config[inference_method])
 
@@ -1,147 +1,503 @@
-import sqlite3
-import threading
-import time
-import random
+from model.db_connections import ConnectionManager
+from model.db_writer import close_database_writer, get_database_writer
+from model.descriptions import compress_text, description_hash
+from model.job_snapshot import DEFAULT_SNAPSHOT_DIR, JobSnapshot
+from model.migrations import STORED_DESCRIPTION, apply_migrations
+from model.retention import JobRetention
 import pandas as pd
 import json
+import os
+
+# Columns of job_postings callers may project, in table order
+JOB_COLUMNS = ("id", "posting_id", "posting_url", "job_title", "description", "experience",
+               "employment_type", "industries", "applied", "insert_timestamp",
+               "evaluated_at", "description_hash", "updated_at")
+
+# How each column is selected, descriptions may be stored compressed in job_descriptions
+COLUMN_SQL = dict({column: "job_postings." + column for column in JOB_COLUMNS},
+                  description=STORED_DESCRIPTION.format(row="job_postings").strip() +
+                  " AS description")
+
+# Fields of an agent answer the dashboard can pivot on
+AGENT_RESULT_FIELDS = ("response", "explanation")
+
+
+# Columns of job_postings in the full text index
+SEARCH_COLUMNS = ("job_title", "description")
+
+
+def full_text_query(text, column=None):
+    """
+    Turn free text typed by a user into an FTS5 query matching postings that contain
+    words starting with every term, so punctuation like C++ or "senior-level" can't break
+    the query syntax.
+    :param column: Only match terms in this column of the index.
+    """
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in text.split()]
+    if column is not None:
+        terms = ["{} : {}".format(column, term) for term in terms]
+    return " AND ".join(terms)
 
 
 class DataBaseHandler:
-    def __init__(self, db_path="database.db"):
-        """Initialize SQLite database with threading lock for safe inserts."""
+    # Triggers version every change and keep tombstones of deletes, see changes_since
+    supports_change_feed = True
+
+    def __init__(self, db_path="database.db", pragmas=None, writer_settings=None,
+                 compress_descriptions=False):
+        """
+        Initialize SQLite database, every thread gets its own persistent WAL connection
+        for reads while all writes go through the process' single writer thread.
+        :param pragmas: Pragmas to override on each connection, e.g. {'cache_size': -64000}.
+        :param writer_settings: DatabaseWriter settings, e.g. {'max_batch_rows': 5000}.
+        :param compress_descriptions: Store new descriptions compressed, once per distinct
+            text, in job_descriptions. They are decompressed transparently when fetched.
+        """
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.pragmas = pragmas
+        self.compress_descriptions = compress_descriptions
+        self.writer_settings = writer_settings or {}
+        self.connections = ConnectionManager(db_path, pragmas)
         self.create_tables()
 
     def get_connection(self):
-        """Retrieve a new database connection."""
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        """Retrieve this thread's database connection. It stays open, don't close it."""
+        return self.connections.connection()
 
-    def create_tables(self):
-        """Creates job postings table."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS job_postings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                posting_id TEXT UNIQUE,
-                posting_url TEXT UNIQUE,
-                job_title TEXT,
-                description TEXT,
-                experience TEXT,
-                employment_type TEXT,
-                industries TEXT,
-                agent_response TEXT,
-                applied BOOLEAN DEFAULT 0,
-                insert_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-    def execute_query_safe(self, query: str, values: list,
-                           retries: int = 5, delay: float = .5) -> None:
-        """Safely run query using locks and retry logic to prevent concurrency issues."""
-        attempt = 0
-        while attempt < retries:
-
-            # Try with our threading lock
-            try:
-                with self.lock:
-                    conn = self.get_connection()
-                    cursor = conn.cursor()
+    def close(self):
+        """Commit any queued writes and close every connection to the database."""
+        close_database_writer(self.db_path)
+        self.connections.close_all()
 
-                    # Execute the query
-                    cursor.executemany(query, values)
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
+    def create_tables(self):
+        """Creates or upgrades our tables and indexes to the latest schema."""
+        apply_migrations(self.get_connection())
 
-                return
+    @property
+    def writer(self):
+        """The writer thread every write to this database goes through."""
+        return get_database_writer(self.db_path, self.pragmas, **self.writer_settings)
 
-            # If we have problems with our threading lock, fallback to retry logic
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e):
-                    attempt += 1
+    def execute_query_safe(self, query: str, values: list, timeout=None) -> None:
+        """
+        Run a query with executemany in its own transaction on the writer thread, and
+        wait until it is committed. Raises the error if it could not be.
+        """
+        self.execute_queries_safe([(query, values)], timeout)
 
-                    # Add jitter in the delay to prevent potential conention issues
-                    time.sleep(delay * random.uniform(.8, 1.2))
-                else:
-                    raise
+    def execute_queries_safe(self, queries: list, timeout=None) -> list:
+        """
+        Run several (query, values) pairs together in a single transaction on the writer
+        thread, and wait until they are committed. Raises the error if they could not be.
+        :return: Rows changed by each query.
+        """
+        return self.writer.execute(queries, timeout)
 
-        print("Query failed after {} attempts".format(retries))
+    def submit_queries(self, queries: list):
+        """
+        Queue (query, values) pairs to be committed together without waiting for them.
+        :return: Future resolving to the rows changed by each query once committed.
+        """
+        return self.writer.submit(queries)
 
-    def insert_jobs(self, job_list, retries=5, delay=0.5):
+    def insert_jobs(self, job_list):
         """Insert new jobs into job table"""
 
         query = """
                     INSERT INTO job_postings (posting_url, posting_id, job_title, description,
-                                              experience, employment_type, industries)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                                              experience, employment_type, industries,
+                                              description_hash)
+                    VALUES (?, ?, ?, NULLIF(?, (
+                        SELECT decompress_text(body)
+                        FROM job_descriptions
+                        WHERE description_hash = ?)), ?, ?, ?, ?)
                     ON CONFLICT(posting_id) DO UPDATE SET
                         job_title=excluded.job_title, description=excluded.description,
                         experience=excluded.experience, employment_type=excluded.employment_type,
-                        industries=excluded.industries
+                        industries=excluded.industries, description_hash=excluded.description_hash
                 """
+        hashes = [description_hash(job["description"]) for job in job_list]
+
+        # Compressed bodies go in first. A description is only left out of job_postings
+        # when it's exactly the stored body, copies differing in case or spacing keep theirs
+        queries = []
+        if self.compress_descriptions:
+            bodies = {digest: job["description"] for job, digest in zip(job_list, hashes)
+                      if digest is not None}
+            queries.append(("""
+                    INSERT OR IGNORE INTO job_descriptions (description_hash, body)
+                    VALUES (?, ?)
+                """, [(digest, compress_text(description))
+                      for digest, description in bodies.items()]))
 
         values = [(job["posting_url"], job["posting_id"], job["job_title"],
-                   job["description"], job["experience"], job["employment_type"],
-                   job["industries"]) for job in job_list]
+                   job["description"], digest, job["experience"], job["employment_type"],
+                   job["industries"], digest)
+                  for job, digest in zip(job_list, hashes)]
+        queries.append((query, values))
 
-        self.execute_query_safe(query, values)
+        self.execute_queries_safe(queries)
 
         return
 
-    def fetch_all_jobs(self):
-        """Fetches all job postings."""
+    def _projection(self, columns):
+        """Check requested columns against the table's and build the SELECT list."""
+        columns = JOB_COLUMNS if columns is None else tuple(columns)
+        unknown = [column for column in columns if column not in JOB_COLUMNS]
+        if unknown or not columns:
+            raise ValueError("Unknown job_postings columns {}".format(unknown))
+        return columns, ", ".join(COLUMN_SQL[column] for column in columns)
+
+    def _first_recent_id(self, days):
+        """Lowest id inserted in the last 'days' days, ids only grow with insert time."""
         conn = self.get_connection()
-        data = pd.read_sql("SELECT * FROM job_postings", conn)
-        conn.close()
-        return data
+        row = conn.execute("""
+                    SELECT MIN(id)
+                    FROM job_postings
+                    WHERE insert_timestamp >= datetime('now', ?)
+                """, ('-{} days'.format(days),)).fetchone()
+        return row[0]
+
+    def _filters(self, days=None, updated_since=None):
+        """WHERE conditions and their values for the optional posting filters."""
+        conditions, values = [], []
+        if days is not None:
+            conditions.append("insert_timestamp >= datetime('now', ?)")
+            values.append('-{} days'.format(days))
+        if updated_since is not None:
+            conditions.append("updated_at >= ?")
+            values.append(updated_since)
+        return conditions, values
+
+    def fetch_jobs_page(self, columns=None, after_id=0, limit=500, days=None,
+                        updated_since=None):
+        """
+        Fetches one page of job postings in id order, using the id as the keyset cursor.
+        :param columns: Columns to fetch, all of them if None. id is always included.
+        :param after_id: Only postings with a greater id, the cursor from the last page.
+        :param limit: Maximum postings in the page.
+        :param days: Only postings inserted in the last 'days' days.
+        :param updated_since: Only postings changed at or after this updated_at.
+        :return: List of row tuples (id first), and the cursor for the next page or
+            None once there are no more postings.
+        """
+        columns, projection = self._projection(columns)
+        conditions, values = self._filters(days, updated_since)
+        # Changed postings are found through their index, left alone the planner walks
+        # every id in order looking for the few that changed
+        query = """
+                    SELECT job_postings.id, {}
+                    FROM job_postings{}
+                    WHERE {}
+                    ORDER BY job_postings.id
+                    LIMIT ?
+                """.format(projection, "" if updated_since is None else
+                           " INDEXED BY job_postings_updated_at",
+                           " AND ".join(["id > ?"] + conditions))
+        values = [after_id] + values + [limit]
+
+        rows = self.get_connection().execute(query, values).fetchall()
+        return rows, rows[-1][0] if len(rows) == limit else None
+
+    def iter_job_chunks(self, columns=None, chunk_size=1000, after_id=0, days=None,
+                        updated_since=None):
+        """
+        Iterates over job postings a page at a time. Every page is its own short query,
+        so readers never hold a snapshot open while the caller works.
+        :return: Generator of lists of row tuples, id first.
+        """
+        if days is not None:
+            first_id = self._first_recent_id(days)
+            if first_id is None:
+                return
+            after_id = max(after_id, first_id - 1)
+
+        while after_id is not None:
+            rows, after_id = self.fetch_jobs_page(columns, after_id, chunk_size, days,
+                                                  updated_since)
+            if rows:
+                yield rows
+
+    def iter_jobs(self, columns=None, chunk_size=1000, days=None):
+        """
+        Iterates over job postings one row at a time.
+        :return: Generator of tuples holding only the requested columns.
+        """
+        for rows in self.iter_job_chunks(columns, chunk_size, days=days):
+            for row in rows:
+                yield row[1:]
+
+    def fetch_column_values(self, column, days=None):
+        """Fetches the set of distinct non null values of one column."""
+        projection = self._projection([column])[1]
+        query = "SELECT DISTINCT {} FROM (SELECT {} FROM job_postings{}) WHERE {} IS NOT NULL"\
+            .format(column, projection, "" if days is None else
+                    " WHERE insert_timestamp >= datetime('now', ?)", column)
+        values = () if days is None else ('-{} days'.format(days),)
+        return {row[0] for row in self.get_connection().execute(query, values)}
+
+    def fetch_jobs(self, columns=None, days=None, updated_since=None):
+        """
+        Fetches job postings as a DataFrame.
+        :param columns: Columns to fetch, all of them if None.
+        :param days: Only postings inserted in the last 'days' days.
+        :param updated_since: Only postings changed at or after this updated_at.
+        """
+        columns, projection = self._projection(columns)
+        conditions, params = self._filters(days, updated_since)
+        query = "SELECT {} FROM job_postings".format(projection)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return pd.read_sql(query, self.get_connection(), params=params)
+
+    def fetch_all_jobs(self, columns=None):
+        """Fetches all job postings."""
+        return self.fetch_jobs(columns)
 
-    def fetch_recent_jobs(self, days=1):
+    def fetch_recent_jobs(self, days=1, columns=None):
         """Fetches job postings from the last 'days' days."""
+        return self.fetch_jobs(columns, days)
+
+    def export_snapshot(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR, **settings):
+        """
+        Appends the postings changed since the last export to a Parquet snapshot.
+        :param settings: JobSnapshot settings, e.g. chunk_size or max_parts.
+        :return: Number of postings written.
+        """
+        return JobSnapshot(snapshot_dir, JOB_COLUMNS, **settings).export(self)
+
+    def fetch_jobs_snapshot(self, columns=None, snapshot_dir=DEFAULT_SNAPSHOT_DIR,
+                            catch_up=True):
+        """
+        Fetches job postings from the Parquet snapshot, much faster than fetch_jobs for
+        the whole table. Falls back to the database if nothing was exported yet.
+        :param columns: Columns to fetch, all of them if None.
+        :param catch_up: Also fetch postings changed since the last export from the
+            database, so the result is as fresh as fetch_jobs.
+        """
+        return JobSnapshot(snapshot_dir, JOB_COLUMNS).fetch(self, self._projection(columns)[0],
+                                                            catch_up)
+
+    def change_token(self):
+        """
+        Token for the current state of job_postings. Take it before reading the table in
+        full, then poll changes_since with it.
+        """
+        row = self.get_connection().execute("SELECT version FROM change_versions").fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, token=0, columns=None, limit=None, include_deleted=False):
+        """
+        Fetches the postings inserted or changed after a change token, in the order they
+        changed. Every change to a posting gets a new row version, so pollers only read
+        what changed instead of the whole table.
+        :param token: Token from change_token or an earlier call, 0 for every posting.
+        :param columns: Columns to fetch, all of them if None.
+        :param limit: Maximum postings to fetch, the rest come with the next token.
+        :param include_deleted: Also return deleted postings, flagged in a deleted column
+            with only their id set.
+        :return: DataFrame of the changed postings and the token to poll with next.
+        """
+        columns, projection = self._projection(columns)
+        query = """
+                    SELECT row_version, {}{}
+                    FROM job_postings
+                    WHERE row_version > ?
+                """.format("0 AS deleted, " if include_deleted else "", projection)
+        params = [token or 0]
+        if include_deleted:
+            query += """
+                    UNION ALL
+                    SELECT row_version, 1, {}
+                    FROM deleted_postings
+                    WHERE row_version > ?
+                """.format(", ".join("id" if column == "id" else "NULL" for column in columns))
+            params.append(token or 0)
+
+        query += " ORDER BY row_version"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        data = pd.read_sql(query, self.get_connection(), params=params)
+        if include_deleted:
+            data["deleted"] = data["deleted"].astype(bool)
+        if data.empty:
+            return data.drop(columns="row_version"), token or 0
+        return data.drop(columns="row_version"), int(data["row_version"].iloc[-1])
+
+    def deleted_since(self, token=0):
+        """
+        Fetches the ids of postings deleted after a change token.
+        :return: List of ids and the token to poll with next.
+        """
+        rows = self.get_connection().execute("""
+                    SELECT row_version, id
+                    FROM deleted_postings
+                    WHERE row_version > ?
+                    ORDER BY row_version
+                """, (token or 0,)).fetchall()
+        if not rows:
+            return [], token or 0
+        return [row[1] for row in rows], rows[-1][0]
+
+    def fetch_recent_posting_keys(self, days=1):
+        """
+        Fetches only the (posting_url, posting_id) pairs of the last 'days' days' postings
+        with a description, streamed off the covering index rather than loaded into memory
+        at once.
+        """
         conn = self.get_connection()
         query = """
-                    SELECT *
+                    SELECT posting_url, posting_id
                     FROM job_postings
-                    WHERE insert_timestamp >= datetime('now', '-{} days')
-                """.format(
-            days)
-        data = pd.read_sql(query, conn)
-        conn.close()
-        return data
+                    WHERE insert_timestamp >= datetime('now', ?)
+                    AND description_hash IS NOT NULL
+                """
+        return conn.execute(query, ('-{} days'.format(days),))
+
+    def search_jobs(self, text, columns=("id", "job_title", "posting_url"), column=None,
+                    limit=100, snippet_tokens=16):
+        """
+        Full text search over job titles and descriptions, best matches first.
+        :param text: Words to search for, postings must contain all of them.
+        :param columns: job_postings columns to return with each match.
+        :param column: Only search job_title or description.
+        :param limit: Maximum matches to return.
+        :param snippet_tokens: Words of context in the snippet around the matches.
+        :return: DataFrame of the columns plus rank (lower is better) and snippet.
+        """
+        projection = self._projection(columns)[1]
+        if column is not None and column not in SEARCH_COLUMNS:
+            raise ValueError("Column {} is not in the full text index".format(column))
+
+        query = """
+                    SELECT {},
+                           bm25(job_postings_fts) AS rank,
+                           snippet(job_postings_fts, -1, '[', ']', '...', ?) AS snippet
+                    FROM job_postings_fts
+                    JOIN job_postings ON job_postings.id = job_postings_fts.rowid
+                    WHERE job_postings_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                """.format(projection)
+        return pd.read_sql(query, self.get_connection(),
+                           params=(snippet_tokens, full_text_query(text, column), limit))
+
+    def search_job_ids(self, text, column=None):
+        """Fetches the ids of every posting matching a full text search."""
+        if not text.split():
+            return set()
+
+        query = "SELECT rowid FROM job_postings_fts WHERE job_postings_fts MATCH ?"
+        return {row[0] for row in self.get_connection().execute(
+            query, (full_text_query(text, column),))}
 
     def fetch_unprocessed_jobs(self):
-        """Fetches job postings that need processing."""
+        """Fetches the id, description and description_hash of postings that need processing."""
         conn = self.get_connection()
         query = """
-                    SELECT id, description
+                    SELECT {}
                     FROM job_postings
-                    WHERE description IS NOT NULL AND agent_response IS NULL
-                    AND description != ''
-                """
+                    WHERE description_hash IS NOT NULL AND evaluated_at IS NULL
+                """.format(self._projection(["id", "description", "description_hash"])[1])
         data = pd.read_sql(query, conn)
-        conn.close()
         return data
 
-    def update_agent_responses(self, response_dict):
-        """Updates agent_response for job postings."""
-        query = """
+    def reuse_agent_results(self):
+        """
+        Copies the agent's answers onto unprocessed postings whose description was
+        already evaluated for another posting, in this run or an earlier one.
+        :return: Number of postings that no longer need processing.
+        """
+        counts = self.execute_queries_safe([
+            ("""
+                    INSERT OR IGNORE INTO agent_results (job_id, question, response,
+                                                         explanation, model, evaluated_at)
+                    SELECT pending.id, done.question, done.response, done.explanation,
+                           done.model, done.evaluated_at
+                    FROM job_postings AS pending
+                    JOIN agent_results AS done ON done.job_id = (
+                        SELECT source.id
+                        FROM job_postings AS source
+                        WHERE source.description_hash = pending.description_hash
+                        AND source.evaluated_at IS NOT NULL
+                        ORDER BY source.evaluated_at DESC
+                        LIMIT 1)
+                    WHERE pending.description_hash IS NOT NULL AND pending.evaluated_at IS NULL
+                """, [()]),
+            ("""
                     UPDATE job_postings
-                    SET agent_response = ?
-                    WHERE id = ?
-                """
+                    SET evaluated_at = CURRENT_TIMESTAMP
+                    WHERE description_hash IS NOT NULL AND evaluated_at IS NULL
+                    AND EXISTS (SELECT 1 FROM agent_results WHERE job_id = job_postings.id)
+                """, [()])
+        ])
+        return counts[1]
 
-        # The agent response will be a python dict, so we need to convert it to a string
-        values = [(response, job_id) for response, job_id in
-                  zip(response_dict["agent_response"], response_dict["id"])]
+    def update_agent_responses(self, response_dict, model=None):
+        """
+        Stores the agent's answers for job postings, one agent_results row per question.
+        :param response_dict: {"id": [...], "agent_response": [...]} where each response
+            maps question -> {"response": ..., "explanation": ...}, as a dict or JSON.
+        :param model: Name of the model that answered.
+        """
+        job_ids, results = [], []
+        for response, job_id in zip(response_dict["agent_response"], response_dict["id"]):
+            if isinstance(response, str):
+                response = json.loads(response)
+            job_ids.append((int(job_id),))
+            results.extend((int(job_id), question, answer.get("response"),
+                            answer.get("explanation"), model)
+                           for question, answer in (response or {}).items())
 
-        self.execute_query_safe(query, values)
+        # Replace any earlier evaluation of the same jobs
+        self.execute_queries_safe([
+            ("DELETE FROM agent_results WHERE job_id = ?", job_ids),
+            ("""
+                    INSERT INTO agent_results (job_id, question, response, explanation, model)
+                    VALUES (?, ?, ?, ?, ?)
+                """, results),
+            ("UPDATE job_postings SET evaluated_at = CURRENT_TIMESTAMP WHERE id = ?", job_ids)
+        ])
 
         return
 
+    def fetch_agent_results(self, field="response", questions=None, job_ids=None):
+        """
+        Fetches one field of the agent's answers as a table of job id by question.
+        :param field: response or explanation.
+        :param questions: Only these questions, all of them if None.
+        :param job_ids: Only these jobs, all of them if None.
+        """
+        if field not in AGENT_RESULT_FIELDS:
+            raise ValueError("Unknown agent result field {}".format(field))
+
+        query = "SELECT job_id, question, {} FROM agent_results".format(field)
+        conditions, params = [], []
+        if questions is not None:
+            conditions.append("question IN ({})".format(", ".join("?" * len(questions))))
+            params.extend(questions)
+        if job_ids is not None:
+            conditions.append("job_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps([int(job_id) for job_id in job_ids]))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        data = pd.read_sql(query, self.get_connection(), params=params)
+        table = data.pivot(index="job_id", columns="question", values=field)
+        table.columns.name = None
+        return table
+
+    def fetch_job_ids_with_response(self, question, response):
+        """Fetches the ids of jobs where the agent gave a response to a question."""
+        query = """
+                    SELECT job_id
+                    FROM agent_results
+                    WHERE question = ? AND response = ?
+                """
+        return {row[0] for row in self.get_connection().execute(query, (question, response))}
+
     def update_applied_status(self, applied_updates):
         """Updates the 'applied' status for job postings."""
         query = """
@@ -154,3 +510,245 @@ class DataBaseHandler:
         self.execute_query_safe(query, values)
 
         return
+
+    def fetch_watermark(self, landing_url):
+        """Fetches the newest posting ids seen on a landing page's last scrape."""
+        conn = self.get_connection()
+        row = conn.execute("SELECT posting_ids FROM landing_watermarks WHERE landing_url = ?",
+                           (landing_url,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def update_watermark(self, landing_url, posting_ids):
+        """Stores the newest posting ids seen on a landing page."""
+        query = """
+                    INSERT INTO landing_watermarks (landing_url, posting_ids, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(landing_url) DO UPDATE SET
+                        posting_ids=excluded.posting_ids, updated_at=excluded.updated_at
+                """
+
+        self.execute_query_safe(query, [(landing_url, json.dumps(posting_ids))])
+
+        return
+
+    def enqueue_shards(self, run_id, shards):
+        """Adds (scraper_name, landing_url) shards to a run, skipping ones already queued."""
+        query = """
+                    INSERT OR IGNORE INTO scrape_shards (run_id, scraper_name, landing_url)
+                    VALUES (?, ?, ?)
+                """
+
+        self.execute_query_safe(query, [(run_id, scraper_name, landing_url)
+                                        for scraper_name, landing_url in shards])
+
+        return
+
+    def claim_shard(self, run_id, worker, max_attempts=2, stale_minutes=30):
+        """
+        Atomically claims the next shard of a run for a worker. Failed shards are retried
+        until max_attempts, and shards whose worker went quiet for stale_minutes are taken over.
+        """
+        def claim(conn):
+            # Runs on the writer thread, which already holds the write lock, so two
+            # workers can't claim the same shard
+            row = conn.execute("""
+                        SELECT id, scraper_name, landing_url
+                        FROM scrape_shards
+                        WHERE run_id = ? AND (
+                            status = 'pending'
+                            OR (status = 'failed' AND attempts < ?)
+                            OR (status = 'running' AND claimed_at < datetime('now', ?)))
+                        ORDER BY attempts, id
+                        LIMIT 1
+                    """, (run_id, max_attempts, '-{} minutes'.format(stale_minutes))).fetchone()
+
+            if row is not None:
+                conn.execute("""
+                        UPDATE scrape_shards
+                        SET status = 'running', worker = ?, attempts = attempts + 1,
+                            claimed_at = CURRENT_TIMESTAMP, error = NULL
+                        WHERE id = ?
+                    """, (worker, row[0]))
+            return row
+
+        row = self.writer.execute([claim])[0]
+
+        if row is None:
+            return None
+        return {'id': row[0], 'scraper_name': row[1], 'landing_url': row[2]}
+
+    def update_shard_progress(self, shard_id, postings):
+        """Records how many postings a running shard has produced so far."""
+        query = """
+                    UPDATE scrape_shards
+                    SET postings = ?, claimed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """
+
+        self.execute_query_safe(query, [(postings, shard_id)])
+
+        return
+
+    def finish_shard(self, shard_id, status, postings, error=None):
+        """Marks a shard as done or failed."""
+        query = """
+                    UPDATE scrape_shards
+                    SET status = ?, postings = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """
+
+        self.execute_query_safe(query, [(status, postings, error, shard_id)])
+
+        return
+
+    def fail_abandoned_shards(self, run_id, workers):
+        """Marks shards still running under workers that have exited as failed."""
+        query = """
+                    UPDATE scrape_shards
+                    SET status = 'failed', error = 'Worker exited before finishing',
+                        finished_at = CURRENT_TIMESTAMP
+                    WHERE run_id = ? AND worker = ? AND status = 'running'
+                """
+
+        self.execute_query_safe(query, [(run_id, worker) for worker in workers])
+
+        return
+
+    def fetch_shards(self, run_id):
+        """Fetches the progress of every shard in a run."""
+        conn = self.get_connection()
+        data = pd.read_sql("SELECT * FROM scrape_shards WHERE run_id = ? ORDER BY id", conn,
+                           params=(run_id,))
+        return data
+
+    def apply_retention(self, **settings):
+        """
+        Archives postings past the retention window and reclaims the space they used.
+        :param settings: JobRetention settings, e.g. days or archive_path.
+        :return: Report of what was archived and the space and read time saved.
+        """
+        return JobRetention(**settings).apply(self)
+
+    def fetch_expired_job_ids(self, days, keep_applied=True, limit=5000):
+        """Fetches the ids of postings inserted more than 'days' days ago, oldest first."""
+        query = """
+                    SELECT id
+                    FROM job_postings
+                    WHERE insert_timestamp < datetime('now', ?){}
+                    ORDER BY insert_timestamp
+                    LIMIT ?
+                """.format(" AND COALESCE(applied, 0) = 0" if keep_applied else "")
+        return [row[0] for row in self.get_connection().execute(
+            query, ('-{} days'.format(days), limit))]
+
+    def fetch_jobs_by_id(self, ids, columns=None):
+        """Fetches the postings with the given ids as a DataFrame."""
+        query = """
+                    SELECT {}
+                    FROM job_postings
+                    WHERE id IN (SELECT value FROM json_each(?))
+                    ORDER BY id
+                """.format(self._projection(columns)[1])
+        return pd.read_sql(query, self.get_connection(), params=(json.dumps(list(ids)),))
+
+    def fetch_agent_results_for_jobs(self, ids):
+        """Fetches every agent_results row of the given job ids."""
+        query = """
+                    SELECT job_id, question, response, explanation, model, evaluated_at
+                    FROM agent_results
+                    WHERE job_id IN (SELECT value FROM json_each(?))
+                """
+        return pd.read_sql(query, self.get_connection(), params=(json.dumps(list(ids)),))
+
+    def delete_jobs(self, ids, keep_applied=True):
+        """
+        Deletes postings along with their agent answers, and the compressed description
+        bodies no remaining posting refers to.
+        :param keep_applied: Skip postings marked applied since they were picked.
+        :return: Number of postings and of description bodies deleted.
+        """
+        ids = json.dumps(list(ids))
+
+        def delete(conn):
+            hashes = json.dumps([row[0] for row in conn.execute("""
+                        SELECT DISTINCT description_hash
+                        FROM job_postings
+                        WHERE id IN (SELECT value FROM json_each(?))
+                        AND description_hash IS NOT NULL
+                    """, (ids,))])
+
+            # agent_results go with them through the foreign key's cascade
+            deleted = conn.execute("""
+                        DELETE FROM job_postings
+                        WHERE id IN (SELECT value FROM json_each(?)){}
+                    """.format(" AND COALESCE(applied, 0) = 0" if keep_applied else ""),
+                                   (ids,)).rowcount
+
+            # Evaluated postings are probed per hash through their partial index, the few
+            # unevaluated ones are read once off theirs
+            removed = conn.execute("""
+                        DELETE FROM job_descriptions
+                        WHERE description_hash IN (SELECT value FROM json_each(?))
+                        AND description_hash NOT IN (
+                            SELECT description_hash FROM job_postings
+                            WHERE description_hash IS NOT NULL AND evaluated_at IS NULL)
+                        AND NOT EXISTS (
+                            SELECT 1 FROM job_postings
+                            WHERE job_postings.description_hash = job_descriptions.description_hash
+                            AND evaluated_at IS NOT NULL)
+                    """, (hashes,)).rowcount
+            return deleted, removed
+
+        return self.writer.execute([delete])[0]
+
+    def storage_stats(self):
+        """Size of the database file, its write ahead log included, and its free space."""
+        conn = self.get_connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        file_bytes = sum(os.path.getsize(path) for path in
+                         (self.db_path, self.db_path + "-wal") if os.path.exists(path))
+        return {"file_bytes": file_bytes, "free_bytes": free_pages * page_size}
+
+    def reclaim_space(self, pages=0, convert=False):
+        """
+        Hands free pages back to the file system. Databases created before incremental
+        auto vacuum was turned on keep their free pages unless converted.
+        :param pages: Most pages to free, 0 for all of them.
+        :param convert: Convert such a database with a full VACUUM, which rewrites the
+            whole file and holds the write lock until it is done.
+        """
+        # VACUUM can't run in a transaction, so not on the writer thread
+        conn = self.connections.open()
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if not convert:
+                    print("{} doesn't use incremental auto vacuum, set convert_auto_vacuum in "
+                          "retention_config to convert it".format(self.db_path))
+                    return
+                print("Converting {} to incremental auto vacuum".format(self.db_path))
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            else:
+                # execute only steps it once, freeing a single page
+                conn.executescript("PRAGMA incremental_vacuum({});".format(int(pages)))
+
+            # Under WAL the file only shrinks once the freed pages are checkpointed
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        finally:
+            conn.close()
+
+    def analyze(self, analysis_limit=1000):
+        """
+        Refreshes the query planner's statistics after many rows changed.
+        :param analysis_limit: Rows sampled per index, 0 reads them all.
+        """
+        def analyze(conn):
+            conn.execute("PRAGMA analysis_limit = {}".format(int(analysis_limit)))
+            try:
+                conn.execute("ANALYZE job_postings")
+                conn.execute("ANALYZE agent_results")
+            finally:
+                conn.execute("PRAGMA analysis_limit = 0")
+
+        self.writer.execute([analyze])
@@ -0,0 +1,141 @@
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from model.process_stats import process_tree_rss_mb
+import time
+import yaml
+
+# Fonts and the usual analytics / ad hosts, none of which we need to read a posting
+DEFAULT_BLOCKED_URLS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*bat.bing.com*", "*hotjar.com*",
+    "*segment.io*", "*cdn.segment.com*", "*px.ads.linkedin.com*", "*snap.licdn.com*"
+]
+
+IMAGE_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico"]
+
+
+class BrowserProfile:
+    """
+    Chrome settings for a scraper class, including which resources the browser never
+    downloads so that each driver uses less memory and finishes loading sooner.
+    """
+
+    def __init__(self, block_images=True, block_fonts_and_trackers=True, blocked_urls=None,
+                 disk_cache_mb=16, lightweight=True):
+        """
+        :param block_images: Don't load or decode images.
+        :param block_fonts_and_trackers: Block the default font and tracker url patterns.
+        :param blocked_urls: Extra url patterns (with * wildcards) to block for this site.
+        :param disk_cache_mb: Size of chrome's disk cache.
+        :param lightweight: Turn off background chrome features we never use.
+        """
+        self.block_images = block_images
+        self.disk_cache_mb = disk_cache_mb
+        self.lightweight = lightweight
+
+        self.blocked_urls = list(blocked_urls or [])
+        if block_fonts_and_trackers:
+            self.blocked_urls.extend(DEFAULT_BLOCKED_URLS)
+        if block_images:
+            self.blocked_urls.extend(IMAGE_URLS)
+
+    def build_options(self):
+        """Build the headless chrome options for this profile."""
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--start-maximized")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(" --no-sandbox")
+
+        # Set our binary location from our docker container, temporarily create own
+        # options.binary_location = "google-chrome"
+
+        if self.disk_cache_mb is not None:
+            options.add_argument("--disk-cache-size={}".format(self.disk_cache_mb * 1024 ** 2))
+
+        if self.block_images:
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2})
+
+        if self.lightweight:
+            for argument in ["--disable-extensions", "--disable-background-networking",
+                             "--disable-component-update", "--disable-default-apps",
+                             "--disable-sync", "--mute-audio", "--no-first-run"]:
+                options.add_argument(argument)
+
+        return options
+
+    def apply(self, driver):
+        """Install the url blocklist on a running driver through the devtools protocol."""
+        if not self.blocked_urls:
+            return
+
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_urls})
+        except WebDriverException as e:
+            print("Could not install url blocklist due to error {}".format(e.__class__))
+
+
+def page_load_seconds(driver):
+    """Seconds the browser spent loading the current page, from the navigation timing."""
+    timing = driver.execute_script(
+        "const t = window.performance.timing; return [t.navigationStart, t.loadEventEnd];")
+    return max(timing[1] - timing[0], 0) / 1000
+
+
+def driver_service_pid(driver):
+    """Pid of the chromedriver process behind a driver, None if it isn't running."""
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+
+def driver_rss_mb(driver):
+    """Resident memory of chromedriver and every browser process it launched."""
+    return process_tree_rss_mb(driver_service_pid(driver))
+
+
+def measure_profile(profile, urls):
+    """
+    Load every url with a fresh driver using the profile.
+    :return: Mean page load seconds and peak RSS of the driver's processes in MB.
+    """
+    driver = webdriver.Chrome(service=Service(), options=profile.build_options())
+    profile.apply(driver)
+
+    load_times, peak_rss = [], 0.0
+    try:
+        for url in urls:
+            driver.get(url)
+            load_times.append(page_load_seconds(driver))
+            peak_rss = max(peak_rss, driver_rss_mb(driver))
+            time.sleep(1)
+    finally:
+        driver.quit()
+
+    return {"mean_load_seconds": sum(load_times) / max(len(load_times), 1),
+            "peak_rss_mb": peak_rss}
+
+
+def compare_profiles(urls, profile_config=None):
+    """Measure a scraper's pages with chrome's defaults and with the blocking profile."""
+    before = BrowserProfile(block_images=False, block_fonts_and_trackers=False,
+                            disk_cache_mb=None, lightweight=False)
+    after = BrowserProfile(**(profile_config or {}))
+
+    return {"before": measure_profile(before, urls), "after": measure_profile(after, urls)}
+
+
+if __name__ == '__main__':
+    with open('config.yaml', 'r') as file:
+        classes = yaml.safe_load(file)['scraper_config']['classes']
+
+    for scraper_name, scraper_config in classes.items():
+        print(scraper_name, compare_profiles(scraper_config['LandingPages'][:3],
+                                             scraper_config.get('BrowserProfile')))
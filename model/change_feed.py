@@ -0,0 +1,95 @@
+"""
+In memory copy of job_postings kept current from the database's change feed, so a
+poller like the dashboard reads the table once and then only what changed.
+"""
+import pandas as pd
+
+# Fallbacks already announced, each is only printed once
+_announced_fallbacks = set()
+
+
+def has_change_feed(db_handler, fallback):
+    """
+    Check if a database keeps a change feed, printing the first time it doesn't what is
+    done instead.
+    :param fallback: What the caller falls back to, e.g. "reloading every poll".
+    """
+    if db_handler.supports_change_feed:
+        return True
+
+    if fallback not in _announced_fallbacks:
+        _announced_fallbacks.add(fallback)
+        print("{} has no change feed, {}".format(type(db_handler).__name__, fallback))
+    return False
+
+
+class JobChangeFeed:
+    def __init__(self, columns=None, batch_size=50000):
+        """
+        :param columns: job_postings columns to keep, all of them if None. id is always kept.
+        :param batch_size: Changed postings read per query while catching up.
+        """
+        self.columns = None if columns is None else \
+            tuple(dict.fromkeys(("id",) + tuple(columns)))
+        self.batch_size = batch_size
+        self.db_path = None
+        self.token = None
+        self.data = None
+
+        # Ids changed or deleted by the last poll, None when it read everything
+        self.changed_ids = None
+
+    def load(self, db_handler):
+        """Read every posting from the snapshot and database, and remember where we are."""
+        # Taken first, anything changing during the read comes again with the next poll
+        token = db_handler.change_token() \
+            if has_change_feed(db_handler, "every poll rereads all postings") else None
+
+        self.data = db_handler.fetch_jobs_snapshot(self.columns)
+        self.db_path, self.token = db_handler.db_path, token
+        self.changed_ids = None
+        return self.data
+
+    def poll(self, db_handler):
+        """
+        Apply the postings changed or deleted since the last load or poll, reloading
+        everything if this is another database or one without a change feed.
+        :return: The current postings in id order.
+        """
+        if self.data is None or self.token is None or db_handler.db_path != self.db_path:
+            return self.load(db_handler)
+
+        batches = []
+        while True:
+            changes, self.token = db_handler.changes_since(self.token, self.columns,
+                                                           self.batch_size,
+                                                           include_deleted=True)
+            if not changes.empty:
+                batches.append(changes)
+            if len(changes) < self.batch_size:
+                break
+
+        self.changed_ids = []
+        if batches:
+            changes = pd.concat(batches, ignore_index=True)
+            self.changed_ids = changes["id"].unique().tolist()
+            self.data = merge_changes(self.data, changes)
+        return self.data
+
+
+def merge_changes(data, changes):
+    """
+    Replace the changed postings in data, add the new ones and drop those flagged in a
+    deleted column, keeping id order.
+    """
+    # A posting changed twice comes twice, in the order it changed
+    changes = changes.drop_duplicates("id", keep="last")
+    kept = data[~data["id"].isin(changes["id"])]
+    if "deleted" in changes:
+        changes = changes[~changes["deleted"]]
+    merged = pd.concat([kept, changes[data.columns]], ignore_index=True)
+
+    # New postings have the highest ids, so only edits of old ones need a sort
+    if not merged["id"].is_monotonic_increasing:
+        merged = merged.sort_values("id", ignore_index=True)
+    return merged
@@ -1,8 +1,12 @@
 import yaml
 from model.scraper import LinkedInScraper, DiceScraper
 from model.DataBaseHandler import DataBaseHandler
+from model.database import open_database
+from model.seen_index import get_seen_index
+from model.job_writer import JobWriter
+from model.shard_runner import run_sharded_scrapers
+from model.driver_watchdog import get_driver_watchdog
 from model.Agent import Agent
-import json
 import pandas as pd
 import numpy as np
 import datetime
@@ -48,11 +52,30 @@ def schedule_functions(config, current_vars: dict):
 
 def run_scrapers(config: dict, db_handler: DataBaseHandler):
     """Executes scrapers in parallel using multithreading."""
+    # Keep browser memory in check, the pools outlive each run
+    watchdog = get_driver_watchdog(**config['scraper_config'].get('DriverWatchdog', {}))
+
+    # Spread landing pages over worker processes (and hosts) when sharding is enabled
+    if config['scraper_config'].get('Sharding', {}).get('enabled', False):
+        run_sharded_scrapers(config, db_handler)
+        print("All scrapers completed.")
+        return
+
+    # Every scraper shares one view of the postings we already have
+    seen_index = get_seen_index(db_handler, **config['scraper_config'].get('SeenIndex', {}))
+    seen_index.refresh()
+
+    # A single writer drains the postings every scraper streams to it
+    writer = JobWriter(db_handler, seen_index=seen_index,
+                       **config['scraper_config'].get('JobWriter', {}))
+
     threads = []
     for scraper_name in config['scraper_config']['classes'].keys():
         thread = threading.Thread(target=run_individual_scraper, args=(scraper_name,
                                                                        config,
-                                                                       db_handler))
+                                                                       db_handler,
+                                                                       seen_index,
+                                                                       writer))
         thread.start()
         threads.append(thread)
 
@@ -60,24 +83,44 @@ def run_scrapers(config: dict, db_handler: DataBaseHandler):
     for thread in threads:
         thread.join()
 
+    writer.close()
+    seen_index.save()
+    print("Scrapers wrote {} postings ({} failed).".format(writer.written, writer.failed))
+
+    # Quit any browser a crashed scraper thread never handed back
+    if watchdog is not None:
+        watchdog.check()
+        print("Driver watchdog recycled {} and reaped {} drivers.".format(watchdog.recycled,
+                                                                         watchdog.reaped))
+
     print("All scrapers completed.")
 
 
-def run_individual_scraper(scraper_name, config, db_handler):
+def run_individual_scraper(scraper_name, config, db_handler, seen_index=None, writer=None):
     """Execute a single scraper instance in a separate process."""
     print(f"Starting scraper: {scraper_name}")
     scraper_class = eval(scraper_name)  # Convert string to class reference
-    scraper = scraper_class(db_handler, config['scraper_config']['classes'][scraper_name])
+    scraper = scraper_class(db_handler, config['scraper_config']['classes'][scraper_name],
+                            seen_index=seen_index)
 
-    scraper.parse_all_searches()
-    scraper.close()
+    # Always hand the browser back to the pool so the next scheduled run starts warm
+    try:
+        job_count = scraper.parse_all_searches(writer)
+        print(f"{scraper_name} extracted {job_count} jobs")
+    finally:
+        scraper.close()
 
 
 def process_unprocessed_jobs(agent: Agent, db_handler: DataBaseHandler):
     """
     Fetches all unprocessed job descriptions and evaluates them using the agent.
-    Updates agent_response in the database.
+    Stores the agent's answers in the database.
     """
+    # Descriptions the agent already evaluated for another posting don't need asking again
+    reused = db_handler.reuse_agent_results()
+    if reused:
+        print("Reused earlier agent responses for {} postings.".format(reused))
+
     jobs_df = db_handler.fetch_unprocessed_jobs()
     if jobs_df.empty:
         print("No unprocessed jobs found.")
@@ -85,32 +128,49 @@ def process_unprocessed_jobs(agent: Agent, db_handler: DataBaseHandler):
 
     response_dict = {"id": [], "agent_response": []}
 
-    # Get unique descriptions to avoid redundant processing
-    unique_descriptions = jobs_df['description'].unique()
+    # Get unique descriptions to avoid redundant processing, reformatted copies share a hash
+    unique_descriptions = jobs_df.drop_duplicates('description_hash')
     agent_responses = {}
 
-    for idx, description in enumerate(unique_descriptions):
+    for idx, (description, digest) in enumerate(zip(unique_descriptions['description'],
+                                                    unique_descriptions['description_hash'])):
         # Live progress update using `sys.stdout.write()`
         progress = f"\rProcessing {idx + 1}/{len(unique_descriptions)} descriptions..."
         sys.stdout.write(progress)
         sys.stdout.flush()
 
         response = agent.ask_questions(description)
-        agent_responses[description] = json.dumps(response)
+        agent_responses[digest] = response
 
     print("\nProcessing complete!")
 
     # Merge responses back with job postings
-    jobs_df["agent_response"] = jobs_df["description"].map(agent_responses)
+    jobs_df["agent_response"] = jobs_df["description_hash"].map(agent_responses)
 
     # Prepare data for database update
     response_dict["id"] = jobs_df["id"].tolist()
     response_dict["agent_response"] = jobs_df["agent_response"].tolist()
 
-    db_handler.update_agent_responses(response_dict)
+    db_handler.update_agent_responses(response_dict, model=getattr(agent, 'model_name', None))
     print("Successfully updated agent responses in the database.")
 
 
+def export_snapshot(config: dict, db_handler: DataBaseHandler):
+    """Appends the postings changed since the last export to the Parquet snapshot."""
+    exported = db_handler.export_snapshot(**config.get('snapshot_config', {}))
+    print("Exported {} changed postings to the snapshot.".format(exported))
+
+
+def apply_retention(config: dict, db_handler: DataBaseHandler):
+    """Archives postings past the retention window and reclaims the space they used."""
+    report = db_handler.apply_retention(**config.get('retention_config', {}))
+    print("Archived {} postings and {} unused descriptions, freeing {:.1f} MB.".format(
+        report["archived"], report["bodies_removed"], report["freed_bytes"] / 2 ** 20))
+    if "read_seconds_after" in report:
+        print("Full read of job_postings took {:.2f}s, down from {:.2f}s.".format(
+            report["read_seconds_after"], report["read_seconds_before"]))
+
+
 def eval_on_loop(config: dict = None,
                  description_eval: Agent = None, db_handler: DataBaseHandler = None):
 
@@ -119,7 +179,7 @@ def eval_on_loop(config: dict = None,
 
     if not db_handler:
         # Initialize components with config if necessary
-        db_handler = DataBaseHandler()
+        db_handler = open_database(config)
 
     if not description_eval:
         description_eval = Agent('model/agent_config.yaml',
@@ -136,5 +196,5 @@ def eval_on_loop(config: dict = None,
 
 if __name__ == "__main__":
     config = load_config('../config.yaml')
-    db_handler = DataBaseHandler('../database.db')
+    db_handler = open_database(config, '../database.db')
     # eval_on_loop(config=config, db_handler=db_handler)
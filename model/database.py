@@ -0,0 +1,48 @@
+from model.DataBaseHandler import DataBaseHandler
+from model.sqlalchemy_handler import SqlAlchemyDataBaseHandler
+from sqlalchemy.engine import make_url
+
+# database_config keys that only apply to the local SQLite file, the rest configure the
+# server connection pool
+SQLITE_SETTINGS = ("compress_descriptions", "pragmas", "writer_settings")
+
+# Scheduled functions reading the change feed, which only SQLite files keep
+CHANGE_FEED_FUNCTIONS = ("export_snapshot",)
+
+
+def scheduled_functions(config):
+    """Names of every function config.yaml schedules."""
+    return {function for functions in ((config or {}).get('schedule') or {}).values()
+            for function in functions or []}
+
+
+def open_database(config=None, db_path="database.db"):
+    """
+    Open the job database the config points at, a server through SQLAlchemy when
+    database_config has a url, otherwise the local SQLite file.
+    :param config: Loaded config.yaml, or None for the local file.
+    :param db_path: SQLite file used without a url. A database URL works here as well,
+        which is how shard workers are handed the parent's database.
+    Raises ValueError for a server when the schedule has functions only SQLite supports.
+    """
+    settings = dict((config or {}).get('database_config') or {})
+    url = settings.pop('url', None)
+    sqlite_settings = {key: settings.pop(key) for key in SQLITE_SETTINGS if key in settings}
+    if url is None and "://" in db_path:
+        url = db_path
+
+    if url is None:
+        return DataBaseHandler(db_path, **sqlite_settings)
+
+    # Refused up front rather than failing every time the schedule comes around
+    backend = make_url(url).get_backend_name()
+    unsupported = sorted(scheduled_functions(config).intersection(CHANGE_FEED_FUNCTIONS))
+    if backend != "sqlite" and unsupported:
+        raise ValueError("{} reads a SQLite database's change feed, take it out of the "
+                         "schedule to run on {}".format(", ".join(unsupported), backend))
+
+    # Servers store descriptions as they are, compressed ones are only read back
+    if sqlite_settings.get('compress_descriptions'):
+        print("compress_descriptions only applies to SQLite files, ignoring it for {}".format(
+            url))
+    return SqlAlchemyDataBaseHandler(url, **settings)
@@ -0,0 +1,94 @@
+from model.descriptions import register_functions
+import sqlite3
+import threading
+
+# Applied to every connection when it's opened. WAL lets readers keep reading while a
+# writer commits, and NORMAL sync is safe under WAL (only the last commits can be lost
+# on power failure, never corrupted).
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,
+    "mmap_size": 256 * 1024 ** 2,
+    "temp_store": "MEMORY",
+    "busy_timeout": 10000,
+    "foreign_keys": "ON",
+}
+
+
+class ConnectionManager:
+    """
+    Hands every thread its own persistent connection to a SQLite database, opened once
+    with our pragmas, instead of connecting again for every query.
+    """
+
+    def __init__(self, db_path, pragmas=None):
+        """
+        :param db_path: Path to the database file.
+        :param pragmas: Pragmas to set on each connection, on top of the defaults.
+        """
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        # Every open connection with the thread it belongs to, so they can all be closed
+        self.connections = []
+
+    def open(self):
+        """Open a new connection with our pragmas applied."""
+        # Each connection is only used by its own thread, but may be closed from another
+        conn = sqlite3.connect(self.db_path, timeout=self.pragmas["busy_timeout"] / 1000,
+                               check_same_thread=False)
+
+        # Lets retention hand freed pages back a few at a time. It only takes on a new
+        # file, older databases are converted by retention when convert_auto_vacuum is set
+        if not conn.execute("PRAGMA page_count").fetchone()[0]:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        for name, value in self.pragmas.items():
+            conn.execute("PRAGMA {} = {}".format(name, value))
+        register_functions(conn)
+        return conn
+
+    def connection(self):
+        """Get the calling thread's connection, opening it on first use."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.open()
+            self.local.conn = conn
+            with self.lock:
+                self._close_dead()
+                self.connections.append((threading.current_thread(), conn))
+        return conn
+
+    def _close_dead(self):
+        """Close the connections of threads that have exited."""
+        alive = []
+        for thread, conn in self.connections:
+            if thread.is_alive():
+                alive.append((thread, conn))
+            else:
+                conn.close()
+        self.connections = alive
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+
+        self.local.conn = None
+        with self.lock:
+            self.connections = [(thread, other) for thread, other in self.connections
+                                if other is not conn]
+        conn.close()
+
+    def close_all(self):
+        """Close every thread's connection. Threads reconnect if they query again."""
+        with self.lock:
+            connections, self.connections = self.connections, []
+
+        for thread, conn in connections:
+            conn.close()
+        self.local = threading.local()
@@ -0,0 +1,239 @@
+from concurrent.futures import Future
+from model.db_connections import ConnectionManager
+import atexit
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+
+class WriteRequest:
+    """Statements from one caller, committed together, with the future they wait on."""
+
+    def __init__(self, queries):
+        """
+        :param queries: List of (query, values) pairs run with executemany, or functions
+            taking the connection that run inside the same transaction.
+        """
+        self.queries = queries
+        self.future = Future()
+        self.rows = sum(1 if callable(item) else len(item[1]) for item in queries)
+
+
+def is_busy(error):
+    """Check if an error means another connection held the lock for too long."""
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message
+
+
+class DatabaseWriter:
+    """
+    The only thread writing to a database file from this process. Writes from every
+    producer are queued and grouped into a single transaction whenever enough rows
+    are waiting or the oldest write has waited long enough. Each caller's statements
+    stay atomic within the group, and every caller gets a future that resolves once
+    they are committed or fails with the error that stopped them.
+    """
+
+    _stop = object()
+
+    def __init__(self, db_path, pragmas=None, queue_size=1000, max_batch_rows=1000,
+                 flush_interval=0.05, retries=5, delay=0.5):
+        """
+        :param db_path: Database file to write to.
+        :param pragmas: Pragmas for the writer's connection.
+        :param queue_size: Write requests allowed to wait before producers block.
+        :param max_batch_rows: Rows that trigger a commit without waiting any longer.
+        :param flush_interval: Seconds the oldest queued write may wait for company.
+        :param retries: Attempts at a group when other processes keep the database locked.
+        :param delay: Seconds between those attempts.
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.delay = delay
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.committed = 0
+        self.transactions = 0
+        self.closed = False
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, queries):
+        """
+        Queue statements to be committed together.
+        :return: Future resolving to one result per query, the rowcount for statements
+            and the return value for functions.
+        """
+        if self.closed:
+            raise RuntimeError("Writer for {} is closed".format(self.db_path))
+
+        request = WriteRequest(queries)
+        self.queue.put(request)
+        return request.future
+
+    def execute(self, queries, timeout=None):
+        """Queue statements and wait until they are committed, raising if they failed."""
+        return self.submit(queries).result(timeout)
+
+    def _collect(self, first):
+        """Gather more waiting requests into a group with the first one."""
+        group, rows = [first], first.rows
+        deadline = time.monotonic() + self.flush_interval
+
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self.queue.get(timeout=remaining) if remaining > 0 \
+                    else self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if request is self._stop:
+                # Nothing can be queued behind it, stop once this group is written
+                self.stopping = True
+                break
+
+            group.append(request)
+            rows += request.rows
+
+        return group
+
+    def _apply(self, conn, request):
+        """Run one request's statements inside a savepoint of the group's transaction."""
+        conn.execute("SAVEPOINT request")
+        try:
+            results = []
+            for item in request.queries:
+                if callable(item):
+                    results.append(item(conn))
+                else:
+                    query, values = item
+                    results.append(conn.executemany(query, values).rowcount)
+            conn.execute("RELEASE request")
+            return results
+        except Exception:
+            conn.execute("ROLLBACK TO request")
+            conn.execute("RELEASE request")
+            raise
+
+    def _write(self, conn, group):
+        """Commit a group, retrying it while the database is locked by someone else."""
+        pending = list(group)
+        for attempt in range(self.retries):
+            outcomes = {}
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for request in pending:
+                    try:
+                        outcomes[request] = (True, self._apply(conn, request))
+                    except sqlite3.OperationalError as e:
+                        if is_busy(e):
+                            raise
+                        outcomes[request] = (False, e)
+                    except Exception as e:
+                        # Only this caller's statements are undone, the rest still commit
+                        outcomes[request] = (False, e)
+                conn.execute("COMMIT")
+
+            except Exception as e:
+                # Left open, the next group's BEGIN would fail as well
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not isinstance(e, sqlite3.OperationalError) or not is_busy(e):
+                    for request in pending:
+                        request.future.set_exception(e)
+                    return
+
+                # Add jitter in the delay to prevent potential contention issues
+                time.sleep(self.delay * random.uniform(.8, 1.2))
+                continue
+
+            self.transactions += 1
+            for request in pending:
+                succeeded, outcome = outcomes[request]
+                if succeeded:
+                    self.committed += request.rows
+                    request.future.set_result(outcome)
+                else:
+                    request.future.set_exception(outcome)
+            return
+
+        error = sqlite3.OperationalError(
+            "database is locked, gave up after {} attempts".format(self.retries))
+        for request in pending:
+            request.future.set_exception(error)
+
+    def _run(self):
+        # Our own connection in autocommit mode, transactions are managed by hand
+        conn = ConnectionManager(self.db_path, self.pragmas).open()
+        conn.isolation_level = None
+
+        try:
+            while True:
+                request = self.queue.get()
+                if request is self._stop:
+                    return
+
+                group = self._collect(request)
+                try:
+                    self._write(conn, group)
+                except Exception as e:
+                    # Every caller in the group hears about it through their future
+                    for failed in group:
+                        if not failed.future.done():
+                            failed.future.set_exception(e)
+
+                if self.stopping:
+                    return
+        finally:
+            conn.close()
+
+    def close(self):
+        """Commit everything still queued and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self._stop)
+        self.thread.join()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_database_writer(db_path, pragmas=None, **settings):
+    """Get the writer for a database file, starting it on first use."""
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer.closed:
+            writer = DatabaseWriter(db_path, pragmas, **settings)
+            _writers[key] = writer
+        return writer
+
+
+def close_database_writer(db_path):
+    """Commit what's queued for a database file and stop its writer."""
+    with _writers_lock:
+        writer = _writers.pop(os.path.abspath(db_path), None)
+    if writer is not None:
+        writer.close()
+
+
+@atexit.register
+def close_database_writers():
+    """Commit everything still queued before the interpreter exits."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+
+    for writer in writers:
+        writer.close()
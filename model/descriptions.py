@@ -0,0 +1,54 @@
+"""
+Content hashes and compression of job descriptions. The same posting text shows up
+across runs and job boards, so descriptions are identified by a hash of their
+normalized text and may be stored once, compressed, in the job_descriptions table.
+"""
+import hashlib
+import re
+import zlib
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Description bodies are mostly prose, level 6 gets nearly all of level 9's savings
+COMPRESSION_LEVEL = 6
+
+
+def normalize_description(description):
+    """Lower case the text and collapse whitespace, so reformatted copies compare equal."""
+    return WHITESPACE_PATTERN.sub(" ", description).strip().lower()
+
+
+def description_hash(description):
+    """
+    Hash of a description's normalized text.
+    :return: Hex digest, or None for a missing or blank description.
+    """
+    if description is None:
+        return None
+
+    normalized = normalize_description(description)
+    if not normalized:
+        return None
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compress_text(text):
+    """Compress text for storage as a BLOB."""
+    if text is None:
+        return None
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress_text(body):
+    """Inverse of compress_text."""
+    if body is None:
+        return None
+    return zlib.decompress(body).decode("utf-8")
+
+
+def register_functions(conn):
+    """
+    Make decompress_text available to SQL on a connection. The full text index reads
+    compressed descriptions through it, so every connection writing postings needs it.
+    """
+    conn.create_function("decompress_text", 1, decompress_text, deterministic=True)
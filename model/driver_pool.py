@@ -0,0 +1,250 @@
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from model.browser_profile import BrowserProfile, driver_service_pid
+from model.process_stats import process_tree, kill_processes
+import atexit
+import threading
+import time
+
+
+class DriverPool:
+    """
+    Pool of warm chrome drivers that scrapers lease and return, so back-to-back runs
+    don't pay the browser cold start every time.
+    """
+
+    def __init__(self, size=1, max_page_loads=100, lease_timeout=None, profile=None):
+        """
+        :param size: Maximum number of drivers alive (leased or idle) at once.
+        :param max_page_loads: Page loads after which a driver is quit and replaced.
+        :param lease_timeout: Seconds to wait for a free driver, None waits forever.
+        :param profile: Browser profile new drivers are launched with.
+        """
+        self.profile = profile if profile is not None else BrowserProfile()
+        self.size = size
+        self.max_page_loads = max_page_loads
+        self.lease_timeout = lease_timeout
+
+        self.condition = threading.Condition()
+        self.idle = []
+        self.leased = 0
+
+        # Page loads per driver, keyed by the driver object
+        self.page_loads = {}
+
+        # Thread holding each leased driver, and drivers the watchdog wants replaced
+        self.owners = {}
+        self.flagged = set()
+
+    def _create_driver(self):
+        """Launch a new chrome driver."""
+        # Get our service (temporarily create own)
+        # service = Service("chromedriver/chromedriver")
+        service = Service()
+        driver = webdriver.Chrome(service=service, options=self.profile.build_options())
+        self.profile.apply(driver)
+        self.page_loads[driver] = 0
+        return driver
+
+    def _quit_driver(self, driver):
+        """Quit a driver and forget about it, killing any browser process left behind."""
+        self.page_loads.pop(driver, None)
+        self.flagged.discard(driver)
+
+        # Note the processes first, chrome's children are reparented once chromedriver exits
+        service_pid = driver_service_pid(driver)
+        pids = process_tree(service_pid) if service_pid is not None else []
+
+        try:
+            driver.quit()
+        except Exception as e:
+            print("Could not cleanly quit driver due to error {}.".format(e.__class__))
+
+        killed = kill_processes(pids)
+        if killed:
+            print("Killed {} browser processes left behind by a driver.".format(killed))
+
+    def is_healthy(self, driver):
+        """Check that the browser behind the driver still responds."""
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def lease(self):
+        """Borrow a driver from the pool, launching one if we have room."""
+        with self.condition:
+            deadline = None if self.lease_timeout is None else time.time() + self.lease_timeout
+
+            while not self.idle and self.leased >= self.size:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No driver became available within {}s".format(
+                        self.lease_timeout))
+                self.condition.wait(remaining)
+
+            driver = self.idle.pop() if self.idle else None
+
+            # Reserve the slot before launching so other threads can't overfill the pool
+            self.leased += 1
+            owner = threading.current_thread()
+
+        try:
+            if driver is not None and not self.is_healthy(driver):
+                self._quit_driver(driver)
+                driver = None
+
+            if driver is None:
+                driver = self._create_driver()
+
+        except Exception:
+            with self.condition:
+                self.leased -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.owners[driver] = owner
+        return driver
+
+    def release(self, driver):
+        """Return a leased driver so the next scraper can reuse the warm browser."""
+        keep = not self.needs_recycle(driver) and self.is_healthy(driver)
+
+        if keep:
+            try:
+                # Drop the page we were on so the idle browser holds as little as possible
+                driver.get("about:blank")
+            except WebDriverException:
+                keep = False
+
+        with self.condition:
+            if self.owners.pop(driver, None) is None:
+                # Already reaped by the watchdog after its owner died
+                return
+            self.leased -= 1
+
+            # The pool may have been shrunk or closed while the driver was out
+            keep = keep and len(self.idle) + self.leased < self.size
+            if keep:
+                self.idle.append(driver)
+            self.condition.notify()
+
+        if not keep:
+            self._quit_driver(driver)
+
+    def record_page_load(self, driver):
+        """Count a page load against the driver."""
+        self.page_loads[driver] = self.page_loads.get(driver, 0) + 1
+
+    def needs_recycle(self, driver):
+        """Check if the driver has served enough pages or grown too large to keep."""
+        return self.page_loads.get(driver, 0) >= self.max_page_loads or driver in self.flagged
+
+    def recycle(self, driver):
+        """Quit a leased driver and hand back a fresh one in its place."""
+        with self.condition:
+            owner = self.owners.pop(driver, None)
+        if owner is None:
+            # Already reaped by the watchdog, which quit it and freed its slot
+            return self.lease()
+        self._quit_driver(driver)
+
+        try:
+            driver = self._create_driver()
+        except Exception:
+            with self.condition:
+                self.leased -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.owners[driver] = owner
+        return driver
+
+    def flag(self, driver):
+        """Mark a driver to be replaced at its next page load or when it's returned."""
+        self.flagged.add(driver)
+
+    def drivers(self):
+        """Every driver alive in the pool, leased and idle."""
+        with self.condition:
+            return list(self.owners) + list(self.idle)
+
+    def evict_idle(self, driver):
+        """Quit an idle driver, returning False if it has been leased in the meantime."""
+        with self.condition:
+            if driver not in self.idle:
+                return False
+            self.idle.remove(driver)
+
+        self._quit_driver(driver)
+        return True
+
+    def reap_orphans(self):
+        """
+        Quit drivers leased by threads that have died without returning them, freeing
+        their slots in the pool.
+        :return: Number of drivers reaped.
+        """
+        with self.condition:
+            orphans = [driver for driver, owner in self.owners.items() if not owner.is_alive()]
+            for driver in orphans:
+                del self.owners[driver]
+                self.leased -= 1
+            self.condition.notify_all()
+
+        for driver in orphans:
+            self._quit_driver(driver)
+        return len(orphans)
+
+    def close(self):
+        """Quit every idle driver. Leased drivers are quit when they are returned."""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size = 0
+
+        for driver in idle:
+            self._quit_driver(driver)
+
+
+# Pools are shared per scraper class so consecutive runs find warm browsers
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_driver_pool(name, size=1, max_page_loads=100, lease_timeout=None, profile=None):
+    """Get the shared pool for a scraper class, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = DriverPool(size=size, max_page_loads=max_page_loads,
+                              lease_timeout=lease_timeout, profile=profile)
+            _pools[name] = pool
+        else:
+            # Let config edits take effect on the next lease, new drivers get the new profile
+            pool.size = size
+            pool.max_page_loads = max_page_loads
+            pool.lease_timeout = lease_timeout
+            if profile is not None:
+                pool.profile = profile
+        return pool
+
+
+def driver_pools():
+    """Every pool created in this process."""
+    with _pools_lock:
+        return list(_pools.values())
+
+
+@atexit.register
+def close_driver_pools():
+    """Quit every pooled driver."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
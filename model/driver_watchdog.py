@@ -0,0 +1,106 @@
+from model.browser_profile import driver_rss_mb
+from model.driver_pool import driver_pools
+import atexit
+import threading
+
+
+class DriverWatchdog:
+    """
+    Background check on every pooled driver's memory. Drivers that grow past the limit
+    are replaced before their next page load, idle ones are quit straight away, and
+    drivers held by scraper threads that died are quit so their browsers don't linger.
+    """
+
+    def __init__(self, interval=15, max_rss_mb=1500, max_total_rss_mb=None):
+        """
+        :param interval: Seconds between checks.
+        :param max_rss_mb: Memory a single driver (chromedriver and its browsers) may use.
+        :param max_total_rss_mb: Memory all drivers together may use before the largest
+            ones are replaced, None for no limit.
+        """
+        self.interval = interval
+        self.max_rss_mb = max_rss_mb
+        self.max_total_rss_mb = max_total_rss_mb
+
+        self.recycled = 0
+        self.reaped = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def check(self):
+        """Check every pool once."""
+        sizes = []
+        for pool in driver_pools():
+            self.reaped += pool.reap_orphans()
+            for driver in pool.drivers():
+                sizes.append((driver_rss_mb(driver), pool, driver))
+
+        total = sum(size for size, _, _ in sizes)
+        over_total = self.max_total_rss_mb is not None and total > self.max_total_rss_mb
+
+        # Largest first so the fewest drivers are restarted to get back under the limit
+        for size, pool, driver in sorted(sizes, key=lambda entry: entry[0], reverse=True):
+            if size <= self.max_rss_mb and not over_total:
+                break
+
+            print("Recycling driver using {:.0f}MB of memory.".format(size))
+            if not pool.evict_idle(driver):
+                pool.flag(driver)
+            self.recycled += 1
+
+            total -= size
+            over_total = self.max_total_rss_mb is not None and total > self.max_total_rss_mb
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print("Driver watchdog check failed due to error {}.".format(e))
+
+    def start(self):
+        """Start checking in the background, if we aren't already."""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+_watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+def get_driver_watchdog(enabled=True, interval=15, max_rss_mb=1500, max_total_rss_mb=None):
+    """
+    Get the process wide watchdog, started and using the latest settings. Returns None
+    when it's disabled.
+    """
+    global _watchdog
+    with _watchdog_lock:
+        if not enabled:
+            if _watchdog is not None:
+                _watchdog.stop()
+                _watchdog = None
+            return None
+
+        if _watchdog is None:
+            _watchdog = DriverWatchdog(interval, max_rss_mb, max_total_rss_mb)
+        else:
+            _watchdog.interval = interval
+            _watchdog.max_rss_mb = max_rss_mb
+            _watchdog.max_total_rss_mb = max_total_rss_mb
+        return _watchdog.start()
+
+
+@atexit.register
+def stop_driver_watchdog():
+    """Stop the watchdog before the pools are closed."""
+    with _watchdog_lock:
+        if _watchdog is not None:
+            _watchdog.stop()
@@ -0,0 +1,109 @@
+import json
+import re
+
+# Runs in the page: reads every field of the spec and returns them as one JSON string
+EXTRACTION_SCRIPT = """
+const spec = arguments[0];
+
+function read(element, field) {
+    if (!element) return null;
+    const value = field.attribute ? element.getAttribute(field.attribute)
+                                  : element[field.property || 'innerText'];
+    return value === undefined ? null : value;
+}
+
+function extract(root, fields) {
+    const result = {};
+    for (const [name, field] of Object.entries(fields)) {
+        if (field.fields) {
+            result[name] = Array.from(root.querySelectorAll(field.selector))
+                .map(element => extract(element, field.fields));
+        } else if (field.all) {
+            result[name] = Array.from(root.querySelectorAll(field.selector))
+                .map(element => read(element, field));
+        } else {
+            result[name] = read(field.selector ? root.querySelector(field.selector) : root,
+                                field);
+        }
+    }
+    return result;
+}
+
+const navigation = performance.getEntriesByType('navigation')[0];
+return JSON.stringify({
+    fields: extract(document, spec),
+    status: navigation && navigation.responseStatus ? navigation.responseStatus : null
+});
+"""
+
+
+class ExtractionSpec:
+    """
+    Declarative description of what to read off a page, executed as a single script in
+    the browser instead of one WebDriver round trip per element.
+
+    Each field maps to a dict with:
+        selector: CSS selector, relative to the page or the enclosing card.
+        property / attribute: What to read, defaults to the element's innerText.
+        all: Read every match as a list instead of the first one.
+        fields: Nested spec read for every match, e.g. each result card on a page.
+        pattern: Regex applied to the text, keeping its first group (None if no match).
+        strip: Strip whitespace off the text, defaults to True.
+    """
+
+    def __init__(self, fields):
+        """
+        :param fields: Field name -> field spec.
+        """
+        self.fields = fields
+
+        # Only the parts the browser needs go into the script, the regexes stay here
+        self.script_fields = self._script_fields(fields)
+        self.patterns = {name: re.compile(field['pattern'], re.DOTALL)
+                         for name, field in fields.items() if field.get('pattern')}
+        self.children = {name: ExtractionSpec(field['fields'])
+                         for name, field in fields.items() if field.get('fields')}
+
+    def _script_fields(self, fields):
+        script_fields = {}
+        for name, field in fields.items():
+            script_field = {key: field[key] for key in ('selector', 'property', 'attribute', 'all')
+                            if field.get(key) is not None}
+            if field.get('fields'):
+                script_field['fields'] = self._script_fields(field['fields'])
+            script_fields[name] = script_field
+        return script_fields
+
+    def _process_value(self, name, value):
+        if value is None:
+            return None
+        if self.fields[name].get('strip', True):
+            value = value.strip()
+        if name in self.patterns:
+            match = self.patterns[name].search(value)
+            value = match.group(1) if match else None
+        return value
+
+    def process(self, raw):
+        """Apply the post-processing to fields read by the script."""
+        result = {}
+        for name, value in raw.items():
+            if name in self.children:
+                result[name] = [self.children[name].process(card) for card in value]
+            elif isinstance(value, list):
+                result[name] = [self._process_value(name, item) for item in value]
+            else:
+                result[name] = self._process_value(name, value)
+        return result
+
+    def extract_with_status(self, driver):
+        """
+        Read every field off the page the driver is on in one call.
+        :return: Processed fields, and the HTTP status of the page if chrome reports it.
+        """
+        raw = json.loads(driver.execute_script(EXTRACTION_SCRIPT, self.script_fields))
+        return self.process(raw['fields']), raw['status']
+
+    def extract(self, driver):
+        """Read every field off the page the driver is on in one call."""
+        return self.extract_with_status(driver)[0]
@@ -0,0 +1,189 @@
+from html.parser import HTMLParser
+import asyncio
+import re
+import aiohttp
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+# Elements that start on their own line when the browser renders text
+BLOCK_TAGS = {"address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "footer",
+              "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol",
+              "p", "pre", "section", "table", "tr", "ul"}
+
+# Elements that never have a closing tag
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+             "source", "track", "wbr"}
+
+# Elements whose contents are never displayed
+HIDDEN_TAGS = {"script", "style", "noscript", "template"}
+
+
+class ElementTextParser(HTMLParser):
+    """
+    Collect the visible text of the first element matching each target, laid out the
+    way selenium's element.text would show it.
+    """
+
+    def __init__(self, targets):
+        """
+        :param targets: Field name -> (tag, attribute, value). A None tag matches any tag,
+            a None attribute matches on tag alone and class attributes match any class.
+        """
+        super().__init__(convert_charrefs=True)
+        self.targets = targets
+        self.results = {}
+
+        # Field -> [open element depth, text pieces] for elements we are inside of
+        self.active = {}
+        self.hidden_depth = 0
+
+    def _matches(self, target, tag, attrs):
+        target_tag, attribute, value = target
+        if target_tag is not None and target_tag != tag:
+            return False
+        if attribute is None:
+            return True
+        if attribute == "class":
+            return value in (attrs.get("class") or "").split()
+        return attrs.get(attribute) == value
+
+    def _write(self, text):
+        for field in self.active:
+            self.active[field][1].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag in ("br", "hr"):
+                self._write("\n")
+            return
+
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth += 1
+
+        for field in self.active:
+            self.active[field][0] += 1
+
+        if tag in BLOCK_TAGS:
+            self._write("\n")
+
+        attrs = dict(attrs)
+        for field, target in self.targets.items():
+            if field not in self.results and field not in self.active \
+                    and self._matches(target, tag, attrs):
+                self.active[field] = [1, []]
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+
+        if tag in HIDDEN_TAGS and self.hidden_depth:
+            self.hidden_depth -= 1
+
+        if tag in BLOCK_TAGS:
+            self._write("\n")
+
+        for field in list(self.active):
+            self.active[field][0] -= 1
+            if self.active[field][0] == 0:
+                self.results[field] = render_text(self.active.pop(field)[1])
+
+    def handle_data(self, data):
+        if not self.hidden_depth:
+            self._write(data)
+
+    def close(self):
+        super().close()
+
+        # Elements that were never closed run to the end of the document
+        for field, (depth, pieces) in self.active.items():
+            self.results[field] = render_text(pieces)
+        self.active = {}
+
+
+def render_text(pieces):
+    """Collapse whitespace the way the browser does and drop empty lines."""
+    lines = "".join(pieces).split("\n")
+    lines = [re.sub(r"\s+", " ", line).strip() for line in lines]
+    return "\n".join(line for line in lines if line)
+
+
+def parse_element_text(html, targets):
+    """
+    Get the visible text of the first element matching each target.
+    :return: Field name -> text, None if the element was not found.
+    """
+    parser = ElementTextParser(targets)
+    parser.feed(html)
+    parser.close()
+    return {field: parser.results.get(field) for field in targets}
+
+
+class AsyncHttpFetcher:
+    """
+    Fetch pages over plain HTTP with asyncio, reusing keep-alive connections from one
+    pooled session for a whole batch of urls.
+    """
+
+    def __init__(self, concurrency=4, timeout=15, headers=None, limiter_for=None,
+                 page_blocked=None):
+        """
+        :param concurrency: Maximum requests in flight (and pooled connections).
+        :param timeout: Total seconds allowed per request.
+        :param headers: Headers sent with every request.
+        :param limiter_for: Function giving the rate limiter to go through for a url.
+        :param page_blocked: Function taking the status and html of a fetched page that
+            checks for signs of us being throttled, so walls served with a 200 still
+            count against the limiter.
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.headers = headers or DEFAULT_HEADERS
+        self.limiter_for = limiter_for
+        self.page_blocked = page_blocked
+
+    def succeeded(self, status, body):
+        """Check if a fetch got us the page rather than an error or a wall."""
+        if status != 200 or body is None:
+            return False
+        return self.page_blocked is None or not self.page_blocked(status, body)
+
+    async def _fetch(self, session, url):
+        """Fetch a single url, returning None for the body if it failed."""
+        limiter = self.limiter_for(url) if self.limiter_for is not None else None
+        if limiter is not None:
+            # The limiter blocks its caller, so wait for it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, limiter.acquire)
+
+        status, body = None, None
+        try:
+            async with session.get(url) as response:
+                status = response.status
+                body = await response.text()
+                return url, status, body if status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print("Could not fetch url {} due to error {}".format(url, e.__class__))
+            return url, None, None
+        finally:
+            if limiter is not None:
+                limiter.release(success=self.succeeded(status, body))
+
+    async def _fetch_all(self, urls):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.headers) as session:
+            return await asyncio.gather(*[self._fetch(session, url) for url in urls])
+
+    def fetch_all(self, urls):
+        """
+        Fetch every url, keeping their order.
+        :return: List of (url, status, html) with html None for failed requests.
+        """
+        if not urls:
+            return []
+        return asyncio.run(self._fetch_all(urls))
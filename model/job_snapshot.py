@@ -0,0 +1,231 @@
+"""
+Columnar snapshot of job_postings as Parquet, partitioned by insert month, for the
+dashboard and offline analyses. Each export only appends the postings changed since
+the last one, read off the database's change feed, so a posting may be in several parts
+and readers keep its latest version.
+"""
+from model.change_feed import has_change_feed
+import json
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DEFAULT_SNAPSHOT_DIR = "job_snapshot"
+
+# Export progress, the leading underscore keeps Arrow from reading it as data
+STATE_FILE = "_snapshot.json"
+
+# Columns stored as integers, every other job_postings column is text
+INTEGER_COLUMNS = ("id", "applied")
+
+PARTITIONING = ds.partitioning(pa.schema([("insert_month", pa.string())]), flavor="hive")
+
+
+class JobSnapshot:
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR, columns=(), chunk_size=50000,
+                 max_parts=8):
+        """
+        :param snapshot_dir: Directory holding the Parquet dataset.
+        :param columns: job_postings columns in the snapshot, must include id and
+            insert_timestamp.
+        :param chunk_size: Postings read from the database per record batch.
+        :param max_parts: Parts an insert month may collect before it is compacted.
+        """
+        self.snapshot_dir = snapshot_dir
+        self.columns = tuple(columns)
+        self.chunk_size = chunk_size
+        self.max_parts = max_parts
+
+        # Which export wrote a row, so the latest version of a posting wins
+        self.schema = pa.schema(
+            [(column, pa.int64() if column in INTEGER_COLUMNS else pa.string())
+             for column in self.columns] +
+            [("snapshot_part", pa.int64()), ("insert_month", pa.string())])
+
+    def state(self):
+        """The change token the last export read up to and the number of exports so far."""
+        path = os.path.join(self.snapshot_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return {"token": 0, "parts": 0}
+        with open(path, "r") as file:
+            state = json.load(file)
+
+        # Snapshots exported by updated_at have no token, the next export reads everything
+        return {"token": state.get("token", 0), "parts": state["parts"]}
+
+    def _save_state(self, state):
+        path = os.path.join(self.snapshot_dir, STATE_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(state, file)
+        os.replace(path + ".tmp", path)
+
+    def _batches(self, db_handler, part, progress):
+        """Record batches of the postings changed since the last export."""
+        while True:
+            changes, progress["token"] = db_handler.changes_since(
+                progress["token"], self.columns, self.chunk_size, include_deleted=True)
+            if changes.empty:
+                return
+
+            progress["deleted"].update(changes.loc[changes["deleted"], "id"].tolist())
+            changes = changes[~changes["deleted"]]
+            if len(changes):
+                # The deleted rows' NULLs leave NaN in the other columns, read as nulls
+                data = {column: pa.array(changes[column], self.schema.field(column).type,
+                                         from_pandas=True) for column in self.columns}
+                data["snapshot_part"] = [part] * len(changes)
+                data["insert_month"] = [(timestamp or "")[:7] for timestamp in
+                                       data["insert_timestamp"].to_pylist()]
+
+                progress["rows"] += len(changes)
+                progress["written"].update(changes["id"].tolist())
+                yield pa.RecordBatch.from_pydict(data, schema=self.schema)
+
+    def export(self, db_handler):
+        """
+        Append the postings changed and remove the postings deleted since the last export.
+        :return: Number of postings written.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        state = self.state()
+        part = state["parts"]
+
+        # Row versions are unique, so every change is exported exactly once
+        progress = {"rows": 0, "token": state["token"], "deleted": set(), "written": set()}
+        ds.write_dataset(self._batches(db_handler, part, progress),
+                         self.snapshot_dir, schema=self.schema, format="parquet",
+                         partitioning=PARTITIONING,
+                         basename_template="part-{:06d}-{{i}}.parquet".format(part),
+                         existing_data_behavior="overwrite_or_ignore")
+
+        # A deleted id inserted again since keeps the row just written
+        deleted = progress["deleted"] - progress["written"]
+        if deleted:
+            self.remove(sorted(deleted))
+        if progress["token"] == state["token"]:
+            return 0
+
+        self._save_state({"token": progress["token"],
+                          "parts": part + 1 if progress["rows"] else part})
+        if progress["rows"]:
+            self.compact()
+        return progress["rows"]
+
+    def _partition_files(self):
+        """Parquet files of every insert month directory."""
+        partitions = {}
+        if not os.path.isdir(self.snapshot_dir):
+            return partitions
+
+        for name in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, name)
+            if name.startswith("insert_month=") and os.path.isdir(path):
+                partitions[path] = sorted(os.path.join(path, file) for file in os.listdir(path)
+                                          if file.endswith(".parquet"))
+        return partitions
+
+    def _rewrite(self, path, files, removed=None):
+        """Replace an insert month's parts with one part of the latest versions."""
+        table = latest_versions(pq.read_table(files, schema=self.schema.remove(
+            self.schema.get_field_index("insert_month"))))
+        if removed is not None:
+            table = table.filter(pc.invert(pc.is_in(table["id"], value_set=removed)))
+
+        # Written before the old parts go, a crash in between only leaves duplicates
+        compacted = None
+        if table.num_rows:
+            compacted = os.path.join(path, "compact-{:06d}.parquet".format(
+                pc.max(table["snapshot_part"]).as_py()))
+            pq.write_table(table, compacted)
+        for file in files:
+            if file != compacted:
+                os.remove(file)
+
+    def compact(self):
+        """Rewrite insert months with more than max_parts parts as one part of latest versions."""
+        for path, files in self._partition_files().items():
+            if len(files) > self.max_parts:
+                self._rewrite(path, files)
+
+    def remove(self, ids):
+        """Drop deleted postings, rewriting only the insert months that hold any of them."""
+        removed = pa.array(ids, pa.int64())
+        for path, files in self._partition_files().items():
+            found = any(pc.any(pc.is_in(pq.read_table(file, columns=["id"])["id"],
+                                        value_set=removed)).as_py() for file in files)
+            if found:
+                self._rewrite(path, files, removed)
+
+    def read(self, columns=None, newer=None, removed=None):
+        """
+        Load the snapshot, memory mapping its files.
+        :param columns: Columns to load, all of them if None.
+        :param newer: DataFrame of postings changed since the last export, with id and the
+            columns, which replace their exported versions.
+        :param removed: Ids deleted since the last export, left out.
+        :return: DataFrame of the latest version of every posting in id order, or None if
+            nothing has been exported yet.
+        """
+        if not self._partition_files():
+            return None
+
+        columns = list(self.columns if columns is None else columns)
+        loaded = list(dict.fromkeys(columns + ["id", "snapshot_part"]))
+        table = pq.read_table(self.snapshot_dir, memory_map=True, partitioning=PARTITIONING,
+                              columns=loaded)
+
+        # Merged while still in Arrow, mixing them in pandas copies every column
+        if newer is not None and len(newer):
+            newer = newer.assign(snapshot_part=self.state()["parts"])
+            table = pa.concat_tables([table, pa.Table.from_pandas(
+                newer[loaded], schema=table.schema, preserve_index=False)])
+
+        table = latest_versions(table)
+        if removed:
+            table = table.filter(pc.invert(pc.is_in(table["id"], value_set=pa.array(
+                removed, pa.int64()))))
+        return table.select(columns).to_pandas()
+
+    def fetch(self, db_handler, columns, catch_up=True):
+        """
+        Load the snapshot of a database handler, falling back to the database itself if
+        nothing was exported yet.
+        :param columns: Validated job_postings columns to load.
+        :param catch_up: Also fetch postings changed since the last export from the
+            database, so the result is as fresh as fetch_jobs.
+        """
+        # id is needed to replace stale rows, even if the caller didn't ask for it
+        fetched = columns if "id" in columns else ("id",) + columns
+        state, changed, removed = self.state(), None, None
+        if catch_up and state["parts"] and has_change_feed(
+                db_handler, "the snapshot is read without catching up"):
+            changes = db_handler.changes_since(state["token"], fetched, include_deleted=True)[0]
+            changed = changes[~changes["deleted"]].drop(columns="deleted")
+            removed = list(set(changes.loc[changes["deleted"], "id"]) - set(changed["id"]))
+
+        data = self.read(columns, newer=changed, removed=removed)
+        if data is None:
+            return db_handler.fetch_jobs(columns)
+        return data
+
+
+def latest_versions(table):
+    """Keep only the row from the newest part of each id, sorted by id."""
+    if table.num_rows == 0:
+        return table
+
+    # Months are read in order and ids grow with insert time, so this is usually sorted
+    ids = table["id"].to_numpy()
+    if (ids[1:] > ids[:-1]).all():
+        return table
+
+    # Order only the integer keys, then copy the rows once
+    order = np.lexsort((-table["snapshot_part"].to_numpy(), ids))
+    ids = ids[order]
+    keep = np.empty(len(ids), dtype=bool)
+    keep[0] = True
+    keep[1:] = ids[1:] != ids[:-1]
+    return table.take(pa.array(order[keep]))
@@ -0,0 +1,109 @@
+from concurrent.futures import Future
+from sqlalchemy.exc import OperationalError
+import queue
+import sqlite3
+import threading
+import time
+
+
+class JobWriter:
+    """
+    Bounded queue of scraped postings drained by a single background thread that
+    inserts them in batches. Producers block when the queue is full, so a slow database
+    slows the scrapers down instead of letting postings pile up in memory.
+    """
+
+    _stop = object()
+
+    def __init__(self, db_handler, queue_size=200, batch_size=25, flush_interval=2.0,
+                 seen_index=None):
+        """
+        :param db_handler: Database the postings are inserted into.
+        :param queue_size: Postings allowed to wait for the writer before producers block.
+        :param batch_size: Postings inserted per batch.
+        :param flush_interval: Seconds a partial batch may wait before it is inserted.
+        :param seen_index: SeenPostingsIndex the stored postings are recorded in.
+        """
+        self.db_handler = db_handler
+        self.seen_index = seen_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failed = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, posting):
+        """
+        Queue a posting for insertion, waiting if the writer is behind.
+        :return: Future resolving once the posting is stored, or failing with the error
+            that kept it out.
+        """
+        future = Future()
+        self.queue.put((posting, future))
+        return future
+
+    def _flush(self, batch):
+        """
+        Insert a batch of (posting, future) pairs. A batch failing on its data is split
+        in halves and retried, so only the postings at fault are left out.
+        """
+        if not batch:
+            return
+
+        try:
+            self.db_handler.insert_jobs([posting for posting, _ in batch])
+        except Exception as e:
+            # Locks and lost connections fail every posting alike, retrying won't help
+            if len(batch) == 1 or isinstance(e, (sqlite3.OperationalError, OperationalError)):
+                self.failed += len(batch)
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+
+            middle = len(batch) // 2
+            self._flush(batch[:middle])
+            self._flush(batch[middle:])
+            return
+
+        self.written += len(batch)
+        for posting, future in batch:
+            # Only postings we got a description for, the rest are tried again next run
+            if self.seen_index is not None and posting.get('description'):
+                self.seen_index.add(posting['posting_url'], posting.get('posting_id'))
+            future.set_result(True)
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._stop:
+                self._flush(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Write when the batch is full or has waited long enough
+            if len(batch) >= self.batch_size or \
+                    (deadline is not None and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def close(self):
+        """Write everything still queued and stop the writer thread."""
+        self.queue.put(self._stop)
+        self.thread.join()
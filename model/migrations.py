@@ -0,0 +1,446 @@
+"""
+Schema migrations for the job database. Each migration runs once, in order, and the
+version reached is kept in the database's user_version pragma.
+
+To change the schema append a new (version, description, steps) entry to MIGRATIONS,
+never edit one that has shipped. Steps are SQL statements or functions taking the
+connection.
+"""
+from model.descriptions import description_hash
+import sqlite3
+
+# A posting's description, from job_postings or decompressed from job_descriptions
+STORED_DESCRIPTION = """
+    COALESCE({row}.description, (
+        SELECT decompress_text(job_descriptions.body)
+        FROM job_descriptions
+        WHERE job_descriptions.description_hash = {row}.description_hash))
+"""
+
+
+def backfill_description_hashes(conn, batch=5000):
+    """Hash the descriptions of postings stored before description_hash existed."""
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, description FROM job_postings
+            WHERE id > ? AND description IS NOT NULL
+            ORDER BY id LIMIT ?
+        """, (last_id, batch)).fetchall()
+        if not rows:
+            return
+
+        conn.executemany("UPDATE job_postings SET description_hash = ? WHERE id = ?",
+                         [(description_hash(description), job_id)
+                          for job_id, description in rows])
+        last_id = rows[-1][0]
+
+
+MIGRATIONS = [
+    (1, "Base tables", [
+        """
+            CREATE TABLE IF NOT EXISTS job_postings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                posting_id TEXT UNIQUE,
+                posting_url TEXT UNIQUE,
+                job_title TEXT,
+                description TEXT,
+                experience TEXT,
+                employment_type TEXT,
+                industries TEXT,
+                agent_response TEXT,
+                applied BOOLEAN DEFAULT 0,
+                insert_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS landing_watermarks (
+                landing_url TEXT PRIMARY KEY,
+                posting_ids TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS scrape_shards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                scraper_name TEXT,
+                landing_url TEXT,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                attempts INTEGER DEFAULT 0,
+                postings INTEGER DEFAULT 0,
+                error TEXT,
+                claimed_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                UNIQUE(run_id, scraper_name, landing_url)
+            )
+        """
+    ]),
+    (2, "Indexes for recent and unprocessed postings", [
+        # Covers the seen index's key lookups, so they never touch the table itself
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_insert_timestamp
+            ON job_postings (insert_timestamp, posting_url, posting_id)
+        """,
+        # Only postings waiting on the agent are in here, so it stays small as history grows
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_unprocessed
+            ON job_postings (id)
+            WHERE description IS NOT NULL AND agent_response IS NULL AND description != ''
+        """,
+        "ANALYZE job_postings"
+    ]),
+    (3, "Normalized agent_results table", [
+        """
+            CREATE TABLE IF NOT EXISTS agent_results (
+                job_id INTEGER NOT NULL REFERENCES job_postings (id) ON DELETE CASCADE,
+                question TEXT NOT NULL,
+                response TEXT,
+                explanation TEXT,
+                model TEXT,
+                evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, question)
+            )
+        """,
+        # Answers are filtered by question and response, e.g. every job with a Yes
+        """
+            CREATE INDEX IF NOT EXISTS agent_results_question_response
+            ON agent_results (question, response, job_id)
+        """,
+        "ALTER TABLE job_postings ADD COLUMN evaluated_at TIMESTAMP",
+
+        # Move the JSON blobs over, we don't know when they were made so use the insert time
+        """
+            INSERT OR REPLACE INTO agent_results (job_id, question, response, explanation,
+                                                  evaluated_at)
+            SELECT job_postings.id, answer.key,
+                   json_extract(answer.value, '$.response'),
+                   json_extract(answer.value, '$.explanation'),
+                   job_postings.insert_timestamp
+            FROM job_postings, json_each(job_postings.agent_response) AS answer
+            WHERE job_postings.agent_response IS NOT NULL
+            AND json_valid(job_postings.agent_response)
+            AND answer.type = 'object'
+        """,
+        """
+            UPDATE job_postings SET evaluated_at = insert_timestamp
+            WHERE agent_response IS NOT NULL
+        """,
+        "DROP INDEX IF EXISTS job_postings_unprocessed",
+        "ALTER TABLE job_postings DROP COLUMN agent_response",
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_unevaluated
+            ON job_postings (id)
+            WHERE description IS NOT NULL AND evaluated_at IS NULL AND description != ''
+        """,
+
+        # Old readers still see agent_response as the JSON it used to be
+        """
+            CREATE VIEW IF NOT EXISTS job_postings_with_agent_response AS
+            SELECT job_postings.*,
+                   CASE WHEN job_postings.evaluated_at IS NULL THEN NULL ELSE (
+                       SELECT json_group_object(question, json_object(
+                           'response', response, 'explanation', explanation))
+                       FROM agent_results
+                       WHERE agent_results.job_id = job_postings.id)
+                   END AS agent_response
+            FROM job_postings
+        """,
+        "ANALYZE"
+    ]),
+    (4, "Full text index over job titles and descriptions", [
+        # External content, the text itself stays in job_postings and only the index is kept
+        """
+            CREATE VIRTUAL TABLE IF NOT EXISTS job_postings_fts USING fts5(
+                job_title, description,
+                content='job_postings', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        """,
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_insert AFTER INSERT ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (rowid, job_title, description)
+                VALUES (new.id, new.job_title, new.description);
+            END
+        """,
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_delete AFTER DELETE ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (job_postings_fts, rowid, job_title, description)
+                VALUES ('delete', old.id, old.job_title, old.description);
+            END
+        """,
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_update
+            AFTER UPDATE OF job_title, description ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (job_postings_fts, rowid, job_title, description)
+                VALUES ('delete', old.id, old.job_title, old.description);
+                INSERT INTO job_postings_fts (rowid, job_title, description)
+                VALUES (new.id, new.job_title, new.description);
+            END
+        """,
+        "INSERT INTO job_postings_fts (job_postings_fts) VALUES ('rebuild')"
+    ]),
+    (5, "Description hashes and compressed description storage", [
+        "ALTER TABLE job_postings ADD COLUMN description_hash TEXT",
+        backfill_description_hashes,
+        # Finds an evaluated posting with the same description, whose answers can be reused
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_evaluated_description_hash
+            ON job_postings (description_hash, evaluated_at)
+            WHERE evaluated_at IS NOT NULL
+        """,
+        # Bodies are stored once per distinct description, when compression is enabled
+        """
+            CREATE TABLE IF NOT EXISTS job_descriptions (
+                description_hash TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            )
+        """,
+
+        # Blank descriptions have no hash, so the hash alone says if there's text to evaluate
+        "DROP INDEX IF EXISTS job_postings_unevaluated",
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_unevaluated
+            ON job_postings (id)
+            WHERE description_hash IS NOT NULL AND evaluated_at IS NULL
+        """,
+
+        # The full text index now reads descriptions wherever they are stored
+        """
+            CREATE VIEW IF NOT EXISTS job_posting_texts AS
+            SELECT job_postings.id, job_postings.job_title,
+                   {} AS description
+            FROM job_postings
+        """.format(STORED_DESCRIPTION.format(row="job_postings")),
+        "DROP TRIGGER IF EXISTS job_postings_fts_insert",
+        "DROP TRIGGER IF EXISTS job_postings_fts_delete",
+        "DROP TRIGGER IF EXISTS job_postings_fts_update",
+        "DROP TABLE IF EXISTS job_postings_fts",
+        """
+            CREATE VIRTUAL TABLE IF NOT EXISTS job_postings_fts USING fts5(
+                job_title, description,
+                content='job_posting_texts', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        """,
+        # Compressed bodies must be inserted before the postings that use them
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_insert AFTER INSERT ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (rowid, job_title, description)
+                VALUES (new.id, new.job_title, {});
+            END
+        """.format(STORED_DESCRIPTION.format(row="new")),
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_delete AFTER DELETE ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (job_postings_fts, rowid, job_title, description)
+                VALUES ('delete', old.id, old.job_title, {});
+            END
+        """.format(STORED_DESCRIPTION.format(row="old")),
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_fts_update
+            AFTER UPDATE OF job_title, description, description_hash ON job_postings
+            BEGIN
+                INSERT INTO job_postings_fts (job_postings_fts, rowid, job_title, description)
+                VALUES ('delete', old.id, old.job_title, {});
+                INSERT INTO job_postings_fts (rowid, job_title, description)
+                VALUES (new.id, new.job_title, {});
+            END
+        """.format(STORED_DESCRIPTION.format(row="old"), STORED_DESCRIPTION.format(row="new")),
+        "INSERT INTO job_postings_fts (job_postings_fts) VALUES ('rebuild')",
+        "DROP VIEW IF EXISTS job_postings_with_agent_response",
+        """
+            CREATE VIEW IF NOT EXISTS job_postings_with_agent_response AS
+            SELECT job_postings.id, job_postings.posting_id, job_postings.posting_url,
+                   job_postings.job_title, {} AS description,
+                   job_postings.experience, job_postings.employment_type,
+                   job_postings.industries, job_postings.applied,
+                   job_postings.insert_timestamp, job_postings.evaluated_at,
+                   job_postings.description_hash,
+                   CASE WHEN job_postings.evaluated_at IS NULL THEN NULL ELSE (
+                       SELECT json_group_object(question, json_object(
+                           'response', response, 'explanation', explanation))
+                       FROM agent_results
+                       WHERE agent_results.job_id = job_postings.id)
+                   END AS agent_response
+            FROM job_postings
+        """.format(STORED_DESCRIPTION.format(row="job_postings")),
+        "ANALYZE"
+    ]),
+    (6, "Track when each posting last changed", [
+        # ALTER TABLE can't default to the current time, the triggers below fill it in
+        "ALTER TABLE job_postings ADD COLUMN updated_at TIMESTAMP",
+        "UPDATE job_postings SET updated_at = COALESCE(evaluated_at, insert_timestamp)",
+        """
+            CREATE INDEX IF NOT EXISTS job_postings_updated_at
+            ON job_postings (updated_at)
+        """,
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_updated_at_insert
+            AFTER INSERT ON job_postings
+            WHEN new.updated_at IS NULL
+            BEGIN
+                UPDATE job_postings SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+            END
+        """,
+        # Skipped when the statement set updated_at itself, which also stops it recursing
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_updated_at_update
+            AFTER UPDATE ON job_postings
+            WHEN new.updated_at IS old.updated_at
+            BEGIN
+                UPDATE job_postings SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+            END
+        """,
+        "ANALYZE job_postings"
+    ]),
+    (7, "Row versions for the change feed", [
+        # Replaced by triggers that also stamp row_version, dropped before the backfill
+        # below so they don't touch updated_at
+        "DROP TRIGGER IF EXISTS job_postings_updated_at_insert",
+        "DROP TRIGGER IF EXISTS job_postings_updated_at_update",
+        "ALTER TABLE job_postings ADD COLUMN row_version INTEGER",
+        # The last version handed out, MAX(row_version) could go back if that row is deleted
+        """
+            CREATE TABLE IF NOT EXISTS change_versions (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """,
+        """
+            UPDATE job_postings SET row_version = ranked.version
+            FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY updated_at, id) AS version
+                  FROM job_postings) AS ranked
+            WHERE ranked.id = job_postings.id
+        """,
+        """
+            INSERT OR IGNORE INTO change_versions (id, version)
+            SELECT 1, COALESCE(MAX(row_version), 0) FROM job_postings
+        """,
+        """
+            CREATE UNIQUE INDEX IF NOT EXISTS job_postings_row_version
+            ON job_postings (row_version)
+        """,
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_version_insert
+            AFTER INSERT ON job_postings
+            BEGIN
+                UPDATE change_versions SET version = version + 1;
+                UPDATE job_postings
+                SET updated_at = COALESCE(new.updated_at, CURRENT_TIMESTAMP),
+                    row_version = (SELECT version FROM change_versions)
+                WHERE id = new.id;
+            END
+        """,
+        # Only updates that change something count, so re-scraping a posting unchanged
+        # doesn't show up in the feed. Skipped for the trigger's own update, which sets
+        # row_version.
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_version_update
+            AFTER UPDATE ON job_postings
+            WHEN new.row_version IS old.row_version AND (
+                new.posting_id IS NOT old.posting_id
+                OR new.posting_url IS NOT old.posting_url
+                OR new.job_title IS NOT old.job_title
+                OR new.description IS NOT old.description
+                OR new.experience IS NOT old.experience
+                OR new.employment_type IS NOT old.employment_type
+                OR new.industries IS NOT old.industries
+                OR new.applied IS NOT old.applied
+                OR new.insert_timestamp IS NOT old.insert_timestamp
+                OR new.evaluated_at IS NOT old.evaluated_at
+                OR new.description_hash IS NOT old.description_hash
+                OR new.updated_at IS NOT old.updated_at)
+            BEGIN
+                UPDATE change_versions SET version = version + 1;
+                UPDATE job_postings
+                SET updated_at = CASE WHEN new.updated_at IS old.updated_at
+                                      THEN CURRENT_TIMESTAMP ELSE new.updated_at END,
+                    row_version = (SELECT version FROM change_versions)
+                WHERE id = new.id;
+            END
+        """,
+        "ANALYZE job_postings"
+    ]),
+    (8, "Tombstones of deleted postings for the change feed", [
+        """
+            CREATE TABLE IF NOT EXISTS deleted_postings (
+                row_version INTEGER PRIMARY KEY,
+                id INTEGER NOT NULL,
+                deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        # Versions come from the same counter, so deletes and changes interleave in order
+        """
+            CREATE TRIGGER IF NOT EXISTS job_postings_version_delete
+            AFTER DELETE ON job_postings
+            BEGIN
+                UPDATE change_versions SET version = version + 1;
+                INSERT INTO deleted_postings (row_version, id)
+                SELECT version, old.id FROM change_versions;
+            END
+        """
+    ]),
+    (9, "Cover description hashes in the recent postings index", [
+        # The seen index only loads postings that have a description, still off the index
+        "DROP INDEX IF EXISTS job_postings_insert_timestamp",
+        """
+            CREATE INDEX job_postings_insert_timestamp
+            ON job_postings (insert_timestamp, posting_url, posting_id, description_hash)
+        """,
+        "ANALYZE job_postings"
+    ]),
+]
+
+
+def schema_version(conn):
+    """Get the migration version the database is at."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def apply_migrations(conn):
+    """
+    Bring the database up to the latest schema. Safe to call from several processes at
+    once, each migration is applied under the write lock by whichever gets there first.
+    :return: Versions that were applied.
+    """
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Someone else may have migrated while we waited for the lock
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+
+            conn.execute("PRAGMA user_version = {}".format(int(version)))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            print("Migration {} ({}) failed, database left at version {}".format(
+                version, description, schema_version(conn)))
+            raise
+
+        applied.append(version)
+        print("Applied database migration {}: {}".format(version, description))
+
+    return applied
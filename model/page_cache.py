@@ -0,0 +1,167 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {"position", "pagenum", "refid", "trackingid", "trk", "searchlink",
+                   "searchid", "utm_source", "utm_medium", "utm_campaign"}
+
+
+def cache_key(url):
+    """Canonical cache key for a url, keeping the query parameters that change the page."""
+    parts = urlsplit(url.strip())
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"),
+                       urlencode(query), parts.fragment))
+
+
+class PageCache:
+    """
+    On disk cache of fetched pages. Bodies are zlib compressed and stored once per
+    sha256 of their contents, while a small sqlite index maps each canonical url and
+    fetch time to the body it returned. Oldest fetches are evicted past the size limit.
+    """
+
+    def __init__(self, cache_dir="page_cache", max_bytes=1024 ** 3):
+        """
+        :param cache_dir: Directory holding the index and compressed bodies.
+        :param max_bytes: Compressed bytes kept before the oldest fetches are evicted.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self.index_path = os.path.join(cache_dir, "index.db")
+
+        conn = self.get_connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT,
+                fetched_at REAL,
+                digest TEXT REFERENCES blobs(digest)
+            );
+            CREATE INDEX IF NOT EXISTS pages_url_fetched ON pages (url, fetched_at);
+            CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched_at);
+        """)
+        self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        conn.close()
+
+    def get_connection(self):
+        """Retrieve a new connection to the cache index."""
+        return sqlite3.connect(self.index_path, check_same_thread=False)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest[2:])
+
+    def store(self, url, html, fetched_at=None):
+        """
+        Cache the body fetched for a url.
+        :return: The sha256 digest the body is stored under.
+        """
+        if html is None:
+            return None
+
+        body = html.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        with self.lock:
+            conn = self.get_connection()
+            known = conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+
+            if not known:
+                compressed = zlib.compress(body, 6)
+                path = self._blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as file:
+                    file.write(compressed)
+                conn.execute("INSERT INTO blobs (digest, size) VALUES (?, ?)",
+                             (digest, len(compressed)))
+                self.total_bytes += len(compressed)
+
+            conn.execute("INSERT INTO pages (url, fetched_at, digest) VALUES (?, ?, ?)",
+                         (cache_key(url), fetched_at, digest))
+            conn.commit()
+
+            if self.total_bytes > self.max_bytes:
+                self._evict(conn)
+
+            conn.close()
+
+        return digest
+
+    def latest(self, url, before=None):
+        """
+        Get the most recently cached body for a url.
+        :param before: Only consider fetches made before this unix time.
+        :return: The page html, None if we never cached it.
+        """
+        conn = self.get_connection()
+        row = conn.execute("""
+                    SELECT digest FROM pages
+                    WHERE url = ? AND fetched_at <= ?
+                    ORDER BY fetched_at DESC LIMIT 1
+                """, (cache_key(url), time.time() if before is None else before)).fetchone()
+        conn.close()
+
+        if row is None:
+            return None
+
+        try:
+            with open(self._blob_path(row[0]), "rb") as file:
+                return zlib.decompress(file.read()).decode("utf-8")
+        except (OSError, zlib.error) as e:
+            print("Could not read cached page for {} due to error {}".format(url, e.__class__))
+            return None
+
+    def _evict(self, conn, batch=20):
+        """Drop the oldest fetches until we are back under the size limit."""
+        while self.total_bytes > self.max_bytes:
+            removed = conn.execute("""
+                        DELETE FROM pages WHERE rowid IN (
+                            SELECT rowid FROM pages ORDER BY fetched_at LIMIT ?)
+                    """, (batch,)).rowcount
+
+            orphans = conn.execute("""
+                        SELECT digest, size FROM blobs
+                        WHERE digest NOT IN (SELECT digest FROM pages)
+                    """).fetchall()
+
+            for digest, size in orphans:
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+                self.total_bytes -= size
+
+            conn.executemany("DELETE FROM blobs WHERE digest = ?",
+                             [(digest,) for digest, size in orphans])
+            conn.commit()
+
+            if removed == 0:
+                break
+
+
+# Scrapers pointed at the same directory share one cache
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_page_cache(cache_dir="page_cache", max_mb=1024):
+    """Get the shared cache for a directory, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = PageCache(cache_dir, max_bytes=max_mb * 1024 ** 2)
+            _caches[cache_dir] = cache
+        return cache
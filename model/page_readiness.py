@@ -0,0 +1,103 @@
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+import threading
+import time
+
+
+def document_complete(driver):
+    """Wait condition for the browser to finish loading the document."""
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+class element_count_increases:
+    """Wait condition for more elements matching the locator than we had before."""
+
+    def __init__(self, locator, previous_count):
+        self.locator = locator
+        self.previous_count = previous_count
+
+    def __call__(self, driver):
+        return len(driver.find_elements(*self.locator)) > self.previous_count
+
+
+class inner_html_changes:
+    """Wait condition for an element to be re-rendered with different contents."""
+
+    def __init__(self, locator, previous_html):
+        self.locator = locator
+        self.previous_html = previous_html
+
+    def __call__(self, driver):
+        try:
+            element = driver.find_element(*self.locator)
+            return element.get_attribute("innerHTML") != self.previous_html
+        except WebDriverException:
+            return False
+
+
+class PageReadiness:
+    """
+    Explicit waits on the elements a page needs before we read it, with a fixed sleep
+    only as the fallback when the wait times out. Every wait is timed so we can see how
+    long pages actually take to get ready.
+    """
+
+    def __init__(self, timeout=10, fallback_sleep=3, poll_frequency=0.2):
+        """
+        :param timeout: Default seconds to wait for a condition.
+        :param fallback_sleep: Seconds to sleep when a condition never became true.
+        :param poll_frequency: Seconds between checks of the condition.
+        """
+        self.timeout = timeout
+        self.fallback_sleep = fallback_sleep
+        self.poll_frequency = poll_frequency
+
+        # Wait label -> list of (seconds waited, whether the condition was met)
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def wait_for(self, driver, condition, label, timeout=None, fallback=True):
+        """
+        Block until the condition holds for the driver.
+        :param driver: Selenium driver to poll.
+        :param condition: Expected condition (callable taking the driver).
+        :param label: Name the wait is recorded under.
+        :param timeout: Seconds to wait, defaults to the configured timeout.
+        :param fallback: Sleep the fallback time if the condition never held.
+        :return: True if the condition was met.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=self.poll_frequency).until(condition)
+            ready = True
+        except TimeoutException:
+            ready = False
+            if fallback:
+                time.sleep(self.fallback_sleep)
+
+        self.record(label, time.perf_counter() - start, ready)
+        return ready
+
+    def record(self, label, seconds, ready):
+        """Store how long a wait took."""
+        with self.lock:
+            self.metrics.setdefault(label, []).append((seconds, ready))
+
+    def summary(self):
+        """Summarize the waits per label."""
+        with self.lock:
+            metrics = {label: list(waits) for label, waits in self.metrics.items()}
+
+        summary = {}
+        for label, waits in metrics.items():
+            seconds = [wait[0] for wait in waits]
+            summary[label] = {
+                "count": len(waits),
+                "mean_seconds": sum(seconds) / len(seconds),
+                "max_seconds": max(seconds),
+                "timeouts": sum(1 for wait in waits if not wait[1])
+            }
+
+        return summary
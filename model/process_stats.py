@@ -0,0 +1,70 @@
+import os
+import signal
+
+
+def _read_ppid(pid):
+    """Get the parent pid of a process from /proc, None if it is gone."""
+    try:
+        with open("/proc/{}/stat".format(pid), "r") as file:
+            # The command name can contain spaces, so split after its closing paren
+            return int(file.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def process_tree(pid):
+    """Get a pid and the pids of every process descended from it."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            parent = _read_ppid(int(entry))
+            if parent is not None:
+                children.setdefault(parent, []).append(int(entry))
+
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def process_rss_mb(pid):
+    """Resident memory of a single process in MB, 0 if it is gone."""
+    try:
+        with open("/proc/{}/status".format(pid), "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and all of its descendants in MB."""
+    if pid is None or not os.path.isdir("/proc"):
+        return 0.0
+    return sum(process_rss_mb(child) for child in process_tree(pid))
+
+
+def process_alive(pid):
+    """Check whether a process is still running (and not just waiting to be reaped)."""
+    try:
+        with open("/proc/{}/stat".format(pid), "r") as file:
+            return file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return False
+
+
+def kill_processes(pids):
+    """Kill every process in the list that is still alive, returning how many were."""
+    killed = 0
+    for pid in pids:
+        if pid != os.getpid() and process_alive(pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except OSError:
+                pass
+    return killed
@@ -0,0 +1,131 @@
+from urllib.parse import urlsplit
+import threading
+import time
+
+
+class DomainLimiter:
+    """
+    Token bucket plus AIMD concurrency limit for a single domain. Every success adds a
+    little rate and concurrency back, every sign of throttling (auth walls, empty pages,
+    HTTP errors) cuts both in half.
+    """
+
+    def __init__(self, rate=1.0, burst=2, max_rate=4.0, min_rate=0.1, concurrency=2,
+                 max_concurrency=8, increase=0.1, decrease=0.5, cooldown=5):
+        """
+        :param rate: Starting requests per second.
+        :param burst: Requests that can go out back to back once tokens have built up.
+        :param max_rate: Ceiling the rate ramps up to.
+        :param min_rate: Floor the rate backs off to.
+        :param concurrency: Starting number of requests allowed in flight.
+        :param max_concurrency: Ceiling for requests in flight.
+        :param increase: Rate added per successful page (and 1/increase successes per slot).
+        :param decrease: Factor the rate and concurrency are multiplied by on failure.
+        :param cooldown: Seconds after a failure before another failure cuts the rate again.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.condition = threading.Condition()
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.successes = 0
+        self.last_backoff = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """Wait for a free concurrency slot and a token, then take both."""
+        with self.condition:
+            while True:
+                self._refill()
+                if self.in_flight < int(self.concurrency) and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+                # Sleep until the next token is due, or until a slot frees up
+                wait = None if self.in_flight >= int(self.concurrency) \
+                    else (1 - self.tokens) / self.rate
+                self.condition.wait(wait)
+
+    def release(self, success=True):
+        """Give back a slot and adjust the limits by how the request went."""
+        with self.condition:
+            self.in_flight -= 1
+
+            if success:
+                # Additive increase
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.successes += 1
+                if self.successes * self.increase >= 1:
+                    self.successes = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+            elif time.monotonic() - self.last_backoff >= self.cooldown:
+                # Multiplicative decrease, once per cooldown so a burst of failures from
+                # requests already in flight doesn't collapse the rate to the floor
+                self.last_backoff = time.monotonic()
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.concurrency = max(1, int(self.concurrency * self.decrease))
+                self.successes = 0
+                self.tokens = min(self.tokens, 0)
+
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {"rate": self.rate, "concurrency": int(self.concurrency),
+                    "in_flight": self.in_flight}
+
+
+def navigation_status(driver):
+    """HTTP status of the page the browser last navigated to, if chrome reports it."""
+    try:
+        return driver.execute_script(
+            "const nav = performance.getEntriesByType('navigation')[0];"
+            "return nav && nav.responseStatus ? nav.responseStatus : null;")
+    except Exception:
+        return None
+
+
+def domain_of(url):
+    """Domain a url is rate limited under, ignoring a leading www."""
+    domain = urlsplit(url).netloc.lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_domain_limiter(url, **settings):
+    """
+    Get the limiter shared by everything in this process that requests the url's domain,
+    creating it with the given settings the first time the domain is seen.
+    """
+    domain = domain_of(url)
+    with _limiters_lock:
+        limiter = _limiters.get(domain)
+        if limiter is None:
+            limiter = DomainLimiter(**settings)
+            _limiters[domain] = limiter
+        return limiter
+
+
+def rate_limit_stats():
+    """Current rate and concurrency of every domain we have limited."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {domain: limiter.stats() for domain, limiter in limiters.items()}
@@ -0,0 +1,180 @@
+"""
+Retention for the job database. Postings past the retention window are moved, with their
+agent answers, to a separate archive database where descriptions are stored compressed,
+then the space they leave is handed back to the file system a little at a time.
+"""
+from model.descriptions import compress_text, decompress_text
+import os
+import sqlite3
+import time
+import pandas as pd
+
+DEFAULT_ARCHIVE_PATH = "job_archive.db"
+
+# Columns of job_postings kept in the archive
+ARCHIVE_COLUMNS = ("id", "posting_id", "posting_url", "job_title", "description", "experience",
+                   "employment_type", "industries", "applied", "insert_timestamp",
+                   "evaluated_at", "description_hash", "updated_at")
+
+ARCHIVE_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS archived_postings (
+            id INTEGER PRIMARY KEY,
+            posting_id TEXT,
+            posting_url TEXT,
+            job_title TEXT,
+            description BLOB,
+            experience TEXT,
+            employment_type TEXT,
+            industries TEXT,
+            applied BOOLEAN,
+            insert_timestamp TIMESTAMP,
+            evaluated_at TIMESTAMP,
+            description_hash TEXT,
+            updated_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS archived_agent_results (
+            job_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            response TEXT,
+            explanation TEXT,
+            model TEXT,
+            evaluated_at TIMESTAMP,
+            PRIMARY KEY (job_id, question)
+        )
+    """
+]
+
+
+class JobArchive:
+    def __init__(self, archive_path=DEFAULT_ARCHIVE_PATH):
+        """
+        :param archive_path: SQLite file the archived postings are kept in.
+        """
+        self.archive_path = archive_path
+
+    def connect(self):
+        """Open the archive, creating its tables on first use."""
+        conn = sqlite3.connect(self.archive_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def store(self, postings, results):
+        """
+        Write postings and their agent answers to the archive. Storing a posting again
+        replaces it, so a batch cut short before it left the job database can be redone.
+        :param postings: DataFrame of ARCHIVE_COLUMNS.
+        :param results: DataFrame of the postings' agent_results rows.
+        """
+        postings = postings.astype(object).where(postings.notna(), None)
+        results = results.astype(object).where(results.notna(), None)
+
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO archived_postings ({})
+                    VALUES ({})
+                """.format(", ".join(ARCHIVE_COLUMNS), ", ".join("?" * len(ARCHIVE_COLUMNS))),
+                    [tuple(compress_text(value) if column == "description" else value
+                           for column, value in zip(ARCHIVE_COLUMNS, row))
+                     for row in postings[list(ARCHIVE_COLUMNS)].itertuples(index=False)])
+                conn.executemany("""
+                    INSERT OR REPLACE INTO archived_agent_results (job_id, question, response,
+                                                                   explanation, model,
+                                                                   evaluated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, list(results.itertuples(index=False)))
+        finally:
+            conn.close()
+
+    def fetch_jobs(self):
+        """Fetches every archived posting with its description decompressed."""
+        conn = self.connect()
+        try:
+            data = pd.read_sql("SELECT * FROM archived_postings ORDER BY id", conn)
+        finally:
+            conn.close()
+        data["description"] = data["description"].map(decompress_text)
+        return data
+
+
+class JobRetention:
+    def __init__(self, days=180, keep_applied=True, archive_path=DEFAULT_ARCHIVE_PATH,
+                 batch_size=5000, vacuum_pages=10000, analysis_limit=1000,
+                 convert_auto_vacuum=False, measure=False):
+        """
+        :param days: Postings inserted longer ago than this are archived.
+        :param keep_applied: Never archive postings we applied to.
+        :param archive_path: SQLite file the archived postings are moved to.
+        :param batch_size: Postings archived and deleted per transaction.
+        :param vacuum_pages: Most free pages handed back to the file system per run, so
+            a run never rewrites the whole file. 0 frees them all.
+        :param analysis_limit: Rows ANALYZE samples per index, 0 reads them all.
+        :param convert_auto_vacuum: Convert a database created before incremental auto
+            vacuum with a one off full VACUUM, which blocks writers while it runs. Without
+            it such a database keeps its free pages for new postings.
+        :param measure: Time a full read of job_postings before and after archiving, two
+            extra passes over the table meant for benchmarks.
+        """
+        self.days = days
+        self.keep_applied = keep_applied
+        self.archive = JobArchive(archive_path)
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.analysis_limit = analysis_limit
+        self.convert_auto_vacuum = convert_auto_vacuum
+        self.measure = measure
+
+    def _time_full_read(self, db_handler):
+        start = time.perf_counter()
+        db_handler.fetch_all_jobs()
+        return time.perf_counter() - start
+
+    def apply(self, db_handler):
+        """
+        Archive the expired postings, delete them along with description bodies nothing
+        refers to any more, then, if any were archived, reclaim space and refresh the
+        planner's statistics.
+        :return: Dict of the postings archived, bodies removed, bytes freed and, if
+            measured, the seconds a full read took before and after.
+        """
+        report = {"archived": 0, "bodies_removed": 0}
+        before = db_handler.storage_stats()
+        ids = db_handler.fetch_expired_job_ids(self.days, self.keep_applied, self.batch_size)
+        if ids and self.measure:
+            report["read_seconds_before"] = self._time_full_read(db_handler)
+
+        while ids:
+            # Archived first, a crash before the delete only leaves a copy in both
+            self.archive.store(db_handler.fetch_jobs_by_id(ids, ARCHIVE_COLUMNS),
+                               db_handler.fetch_agent_results_for_jobs(ids))
+            deleted, removed = db_handler.delete_jobs(ids, self.keep_applied)
+            report["archived"] += deleted
+            report["bodies_removed"] += removed
+
+            # Postings applied to meanwhile were kept, so stop rather than retry them
+            if deleted < len(ids):
+                break
+            ids = db_handler.fetch_expired_job_ids(self.days, self.keep_applied,
+                                                   self.batch_size)
+
+        # With nothing archived no space was freed and the statistics still hold
+        if report["archived"]:
+            db_handler.reclaim_space(self.vacuum_pages, self.convert_auto_vacuum)
+            db_handler.analyze(self.analysis_limit)
+            if self.measure:
+                report["read_seconds_after"] = self._time_full_read(db_handler)
+
+        after = db_handler.storage_stats()
+        report["file_bytes"] = after["file_bytes"]
+        report["freed_bytes"] = before["file_bytes"] - after["file_bytes"]
+        report["free_bytes"] = after["free_bytes"]
+        report["archive_bytes"] = os.path.getsize(self.archive.archive_path) \
+            if os.path.exists(self.archive.archive_path) else 0
+        return report
@@ -1,55 +1,152 @@
-from selenium import webdriver
 from selenium.common.exceptions import NoSuchElementException, ElementNotInteractableException, \
     ElementClickInterceptedException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 from model.DataBaseHandler import DataBaseHandler
+from model.driver_pool import get_driver_pool
+from model.browser_profile import BrowserProfile
+from model.http_fetch import AsyncHttpFetcher, parse_element_text
+from model.seen_index import SeenPostingsIndex, get_seen_index, canonicalize_id
+from model.job_writer import JobWriter
+from model.page_cache import get_page_cache
+from model.rate_limiter import get_domain_limiter, navigation_status, rate_limit_stats
+from model.extraction_spec import ExtractionSpec
+from model.page_readiness import PageReadiness, document_complete, element_count_increases, \
+    inner_html_changes
+from selenium.webdriver.support import expected_conditions as EC
+from html import unescape
+import copy
+import queue
 import re
-import time
-import pandas as pd
-import yaml
+import threading
 import os
 import json
-# import threading
+
+HREF_PATTERN = re.compile(r'href=["\'](.*?)["\']')
+
+# Post-processing of LinkedIn posting pages
+LINKEDIN_ID_PATTERN = re.compile(r"-([\d]+)(?:[/?#]|$)")
+LINKEDIN_QUERY_ID_PATTERN = re.compile(r"-([\d]+)\?")
+SENIORITY_PATTERN = re.compile("Seniority level\n(.*?)\nEmployment", re.DOTALL)
+EMPLOYMENT_TYPE_PATTERN = re.compile("Employment type\n(.*?)\nJob function", re.DOTALL)
+INDUSTRIES_PATTERN = re.compile("Industries\n(.*?)", re.DOTALL)
 
 
 # Common webscraper functions
 class BaseScraper:
 
-    def __init__(self, db_handler: DataBaseHandler, config: dict):
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--start-maximized")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument(" --no-sandbox")
+    # Elements each site waits on before reading a page, overridden per scraper
+    landing_ready_locator = None
+    detail_ready_locator = None
+
+    # Substring that marks a link on a landing page as a job posting
+    job_link_marker = None
+
+    # What each site reads off its landing and posting pages in a single script call
+    landing_spec = None
+    detail_spec = None
+
+    def __init__(self, db_handler: DataBaseHandler, config: dict,
+                 seen_index: SeenPostingsIndex = None):
+        # Replaying re-parses cached pages, so there is no browser to borrow
+        self.replay = config.get('ReplayFromCache', False)
+
+        # Borrow a warm browser from the pool shared by every instance of this class
+        pool_config = config.get('DriverPool', {})
+        self.driver_pool = get_driver_pool(self.__class__.__name__,
+                                           size=pool_config.get('size', 1),
+                                           max_page_loads=pool_config.get('max_page_loads', 100),
+                                           lease_timeout=pool_config.get('lease_timeout'),
+                                           profile=BrowserProfile(
+                                               **config.get('BrowserProfile', {})))
+        self.driver = None if self.replay else self.driver_pool.lease()
+        self.db_handler = db_handler
 
-        # Since we are running chrome on multiple threads, we need to have a unique dir for each id
-        # thread_id = threading.get_ident()
-        # options.add_argument(f"--user-data-dir=chrome-user-data-{thread_id}")
+        self.config = config
 
-        # Set our binary location from our docker container, temporarily create own
-        # options.binary_location = "google-chrome"
+        # Postings we already have, shared with the other scrapers on this database
+        self.seen_index = seen_index if seen_index is not None else get_seen_index(db_handler)
 
-        # Get our service (temporarily create own)
-        # service = Service("chromedriver/chromedriver")
-        service = Service()
+        # Explicit waits with per-site timeouts replace our fixed sleeps
+        readiness_config = config.get('Readiness', {})
+        self.readiness = PageReadiness(timeout=readiness_config.get('timeout', 10),
+                                       fallback_sleep=readiness_config.get('fallback_sleep', 3))
 
-        self.driver = webdriver.Chrome(service=service, options=options)
-        self.db_handler = db_handler
+        # Keep the raw pages we fetch so they can be re-parsed later without the internet
+        cache_config = config.get('PageCache', {})
+        self.page_cache = get_page_cache(cache_config.get('path', 'page_cache'),
+                                         cache_config.get('max_mb', 1024)) \
+            if cache_config.get('enabled', False) or self.replay else None
 
-        self.config = config
+        # Requests to each site share one adaptive limit across threads and scrapers
+        self.rate_limit_config = config.get('RateLimit', {})
+
+        # Fields read off the last page we navigated to with an extraction spec
+        self.page_fields = None
+
+        # (landing_url, newest posting ids) of the search being parsed, saved as its
+        # watermark once the writer has stored those postings
+        self.pending_watermark = None
+
+    def limiter_for(self, url):
+        """Get the rate limiter for the domain of a url."""
+        return get_domain_limiter(url, **self.rate_limit_config)
+
+    def page_blocked(self, label, status, fields=None):
+        """
+        Check whether the page we just loaded shows signs of us being throttled, overridden
+        per scraper for site specific walls.
+        :param label: What kind of page was loaded.
+        :param status: HTTP status of the page, None if unknown.
+        :param fields: What the extraction spec read off the page, if one was used.
+        """
+        return status is not None and status >= 400
+
+    def http_page_blocked(self, status, html):
+        """Check a posting page fetched without the browser the same way navigate does."""
+        return self.page_blocked("detail", status, parse_element_text(html, self.detail_targets))
+
+    def navigate(self, url, ready_locator=None, label="page", spec=None):
+        """
+        Load the webpage and wait until it is ready to be read.
+        :param url: Page to load.
+        :param ready_locator: Element to wait for, otherwise wait for the document to load.
+        :param label: Name the wait is recorded under in our readiness metrics.
+        :param spec: Extraction spec to read the page with once it's ready, the fields
+            are left in self.page_fields.
+        :return: True if the page got ready and doesn't look like we were throttled.
+        """
+        # Swap out browsers that have served too many pages before they bloat
+        if self.driver_pool.needs_recycle(self.driver):
+            self.driver = self.driver_pool.recycle(self.driver)
+
+        # Wait our turn for the site, backing off further the more it pushes back
+        limiter = self.limiter_for(url)
+        limiter.acquire()
+        success = False
+        try:
+            self.driver.get(url)
+            self.driver_pool.record_page_load(self.driver)
+            self.url = url
+
+            condition = EC.presence_of_element_located(ready_locator) if ready_locator \
+                else document_complete
+            ready = self.readiness.wait_for(self.driver, condition, label)
+
+            # Reading the page also tells us its status, so it costs no extra round trip
+            if spec is not None:
+                self.page_fields, status = spec.extract_with_status(self.driver)
+            else:
+                self.page_fields, status = None, navigation_status(self.driver)
+
+            success = ready and not self.page_blocked(label, status, self.page_fields)
+        finally:
+            limiter.release(success)
 
-    def navigate(self, url):
-        """Load the webpage."""
-        self.driver.get(url)
-        self.url = url
-        time.sleep(3)
+        return success
 
     def navigate_landing_page(self, url):
         """Navigate and handle popups from our starting page."""
-        self.navigate(url)
+        self.navigate(url, self.landing_ready_locator, "landing")
         self.handle_landing_popups()
 
     def handle_landing_popups(self):
@@ -63,49 +160,297 @@ class BaseScraper:
     def extract_job_information(self):
         return NotImplementedError()
 
+    def parse_job_html(self, url, html):
+        """Abstract method for extracting job information out of a fetched page."""
+        return NotImplementedError()
+
+    def posting_id_from_url(self, url):
+        """Abstract method for getting the site's posting id out of a posting url."""
+        return None
+
+    def links_from_html(self, html):
+        """Get the job posting links out of a chunk of landing page html."""
+        return self.job_links([unescape(link) for link in HREF_PATTERN.findall(html)])
+
+    def job_links(self, links):
+        """Keep only the links that point to job postings."""
+        return [link for link in links if link and self.job_link_marker in link]
+
+    def cache_page(self, url, html=None):
+        """Store a fetched page in the page cache, defaulting to what the browser shows."""
+        if self.page_cache is None:
+            return
+
+        try:
+            self.page_cache.store(url, html if html is not None else self.driver.page_source)
+        except Exception as e:
+            print("Could not cache page {} due to error {}".format(url, e.__class__))
+
+    def cached_landing_pages(self, landing_url):
+        """Get the cached html of a landing page, one entry per page of results."""
+        html = self.page_cache.latest(landing_url)
+        return [html] if html is not None else []
+
+    def replay_search(self, landing_url):
+        """
+        Re-parse a landing page and its jobs out of the page cache, without a browser
+        """
+        links = []
+        for html in self.cached_landing_pages(landing_url):
+            links.extend(self.links_from_html(html))
+
+        for link in dict.fromkeys(links):
+            html = self.page_cache.latest(link)
+
+            # Don't overwrite what we have with an empty posting for a page we never cached
+            if html is None:
+                continue
+            yield self.parse_job_html(link, html)
+
     def extract_all_for_search(self, landing_url):
         """
         Load and parse information from all jobs listed
         """
+        return list(self.iter_jobs_for_search(landing_url))
+
+    def iter_jobs_for_search(self, landing_url):
+        """
+        Load a landing page and yield the information of each job as soon as it's extracted
+        """
+        if self.replay:
+            yield from self.replay_search(landing_url)
+            return
+
         self.navigate_landing_page(landing_url)
 
         # Get our job links
         links = self.extract_jobs_list()
 
-        # Get our information
-        job_set = [self.extract_job_information(job) for job in links]
+        # Claim these so the other landing pages and scrapers don't visit them again this
+        # run, they're only seen for good once the writer has stored them
+        for link in links:
+            self.seen_index.claim(link, self.posting_id_from_url(link))
+
+        # Detail pages that don't need javascript can skip the browser entirely
+        if self.config.get('DetailFetchMode', 'selenium') == 'http':
+            yield from self.extract_jobs_http(links)
+            return
+
+        # Get our information, fanning out over several drivers if configured
+        workers = min(self.config.get('DetailWorkers', 1), self.driver_pool.size, len(links))
+        if workers > 1:
+            yield from self.iter_jobs_parallel(links, workers)
+        else:
+            for job in links:
+                yield self.extract_job_information(job)
+
+    def extract_jobs_http(self, links):
+        """Fetch job posting pages over plain HTTP and parse them without the browser."""
+        http_config = self.config.get('HttpFetch', {})
+        fetcher = AsyncHttpFetcher(concurrency=http_config.get('concurrency', 4),
+                                   timeout=http_config.get('timeout', 15),
+                                   limiter_for=self.limiter_for,
+                                   page_blocked=self.http_page_blocked)
+
+        job_set = []
+        for url, status, html in fetcher.fetch_all(links):
+            if html is not None:
+                self.cache_page(url, html)
+            job_set.append(self.parse_job_html(url, html))
 
         return job_set
 
-    def parse_all_searches(self):
+    def spawn_worker(self):
+        """Create a copy of this scraper that runs on its own pooled driver."""
+        worker = copy.copy(self)
+        worker.driver = self.driver_pool.lease()
+        return worker
+
+    def iter_jobs_parallel(self, links, workers):
         """
-        Parse all landing pages for a scraper class in the config
+        Extract job information with several drivers at once, yielding jobs as they finish.
+        :param links: Job posting urls to visit.
+        :param workers: Number of drivers to use, including our own.
         """
-        job_set = []
+        pending = queue.Queue()
+        for link in links:
+            pending.put(link)
+
+        # Bounded so that workers wait when whoever consumes our jobs falls behind
+        results = queue.Queue(maxsize=workers * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def offer(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def work(first_worker):
+            # The first worker reuses our driver, the rest borrow from the pool
+            scraper = None
+            try:
+                scraper = self if first_worker else self.spawn_worker()
+                while not stopped.is_set():
+                    try:
+                        link = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    offer(scraper.extract_job_information(link))
+            except Exception as e:
+                print("Detail worker failed due to error {}.".format(e))
+            finally:
+                if scraper is not None and not first_worker:
+                    scraper.close()
+                offer(done)
+
+        threads = [threading.Thread(target=work, args=(idx == 0,), daemon=True)
+                   for idx in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            finished = 0
+            while finished < workers:
+                job = results.get()
+                if job is done:
+                    finished += 1
+                else:
+                    yield job
+
+            # Anything a failed worker left behind gets picked up on our own driver
+            while True:
+                try:
+                    link = pending.get_nowait()
+                except queue.Empty:
+                    break
+                yield self.extract_job_information(link)
+
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def parse_all_searches(self, writer: JobWriter = None):
+        """
+        Parse all landing pages for a scraper class in the config, streaming every job
+        into the database writer as soon as it's extracted. Jobs aren't collected into a
+        DataFrame anymore, they are in the database once the writer is closed.
+        :param writer: Shared writer to queue jobs on, otherwise we run our own.
+        :return: Number of jobs extracted.
+        """
+        own_writer = writer is None
+        if own_writer:
+            writer = JobWriter(self.db_handler, seen_index=self.seen_index)
+
+        job_count = 0
+        try:
+            for landing_page in self.config['LandingPages']:
+                job_count += self.parse_search(landing_page, writer)
+        finally:
+            if own_writer:
+                writer.close()
 
-        for landing_page in self.config['LandingPages']:
-            job_set.extend(self.extract_all_for_search(landing_page))
+        print("{} page readiness: {}".format(self.__class__.__name__, self.readiness.summary()))
+        print("{} rate limits: {}".format(self.__class__.__name__, rate_limit_stats()))
 
-            # Insert into our database
-            self.db_handler.insert_jobs(job_set)
+        return job_count
 
-        df = pd.DataFrame(job_set)
-        return df
+    def parse_search(self, landing_page, writer: JobWriter, progress=None):
+        """
+        Parse a single landing page, streaming its jobs into the writer, and wait until
+        the writer has stored them
+        :param progress: Called with the running job count after each job.
+        """
+        self.pending_watermark = None
+        job_count = 0
+        stored = []
+        for job in self.iter_jobs_for_search(landing_page):
+            stored.append((job, writer.put(job)))
+            job_count += 1
+            if progress is not None:
+                progress(job_count)
+
+        errors = [future.exception() for _, future in stored if future.exception() is not None]
+        if errors:
+            print("{} of {} jobs from {} could not be stored, e.g. due to error {}".format(
+                len(errors), job_count, landing_page, errors[0]))
+
+        self.save_watermark(stored)
+        return job_count
+
+    def save_watermark(self, stored):
+        """
+        Save the watermark of the search just parsed, leaving out postings that weren't
+        stored with a description so the next run doesn't stop short of them
+        :param stored: (job, future from the writer) pairs of the search's jobs.
+        """
+        if self.pending_watermark is None:
+            return
+        landing_url, newest_ids = self.pending_watermark
+        self.pending_watermark = None
+
+        missing = {canonicalize_id(job['posting_id']) for job, future in stored
+                   if future.exception() is not None or not job.get('description')}
+        newest_ids = [posting_id for posting_id in newest_ids if posting_id not in missing]
+        if newest_ids:
+            self.db_handler.update_watermark(landing_url, newest_ids)
 
     def close(self):
-        """Close the browser."""
-        self.driver.quit()
+        """Return the browser to the pool for the next run."""
+        if self.driver is not None:
+            self.driver_pool.release(self.driver)
+            self.driver = None
 
 
 class LinkedInScraper(BaseScraper):
 
+    landing_ready_locator = (By.CLASS_NAME, "two-pane-serp-page__results-list")
+    detail_ready_locator = (By.TAG_NAME, "h1")
+    job_link_marker = "jobs/view"
+
+    landing_spec = ExtractionSpec({
+        'links': {'selector': '.two-pane-serp-page__results-list a[href]',
+                  'attribute': 'href', 'all': True}})
+    detail_spec = ExtractionSpec({
+        'job_title': {'selector': 'h1'},
+        'description': {'selector': '.decorated-job-posting__details'},
+        'criteria': {'selector': '.description__job-criteria-list'}})
+
+    # Elements read off a posting page when fetched without the browser
+    detail_targets = {'job_title': ('h1', None, None),
+                      'description': (None, 'class', 'decorated-job-posting__details'),
+                      'criteria': (None, 'class', 'description__job-criteria-list')}
+
+    def page_blocked(self, label, status, fields=None):
+        """Posting pages that show the "Join LinkedIn" wall or no title mean we're throttled."""
+        if super().page_blocked(label, status, fields):
+            return True
+        if label != "detail":
+            return False
+
+        if fields is not None:
+            title = fields['job_title']
+        else:
+            titles = self.driver.find_elements(*self.detail_ready_locator)
+            title = titles[0].text.strip() if titles else None
+        return not title or title == "Join LinkedIn"
+
     def handle_landing_popups(self):
         """
         Method for navigating to the search page and handling popups
         """
 
-        # Add extra time to sleep until objects are loaded
-        time.sleep(3)
+        # Give the sign in modal a chance to show up, it's fine if it never does
+        self.readiness.wait_for(self.driver,
+                                EC.visibility_of_element_located(
+                                    (By.ID, "base-contextual-sign-in-modal")),
+                                "sign_in_modal",
+                                timeout=self.config.get('Readiness', {}).get('popup_timeout', 3),
+                                fallback=False)
 
         try:
             # Get our sign in and check if we need to return
@@ -136,42 +481,29 @@ class LinkedInScraper(BaseScraper):
         Method for getting the list of hrefs from the job list
         """
         try:
-            # Scroll to the bottom of the page
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-
-            # Sleep until we have the load more jobs load
-            time.sleep(5)
-
-            # Get the list
-            job_list = self.driver.find_elements(By.CLASS_NAME, "two-pane-serp-page__results-list")
-
-            # Extract the inner html
-            job_html = job_list[0].get_attribute("innerHTML")
-
-            # Regex search for the hrefs
-            href_pattern = r'href=["\'](.*?)["\']'
-            job_links = re.findall(href_pattern, job_html)
-
-            # Don't insert jobs that are in database
-            current_job_links = self.db_handler.fetch_recent_jobs()
-
-            if type(current_job_links) is None or current_job_links.shape[0] == 0:
-                current_job_links = pd.DataFrame(data={"posting_url": [],
-                                                       "posting_id": []})
-
-            # We need to remove any job links with https://www.linkedin.com/company/
-            job_links = [job for job in job_links
-                         if "jobs/view" in job
-                         and job not in current_job_links['posting_url']
-                         ]
-
-            # Also check if any of the job ids are present. If so skip them
-            for job_id in current_job_links['posting_id'].dropna():
-                for job in job_links:
-                    if type(job) is str and job_id in job:
-                        job_links.remove(job)
-
-            return job_links
+            # Scroll to the bottom of the page, counting the cards we had in the same call
+            card_locator = (By.CSS_SELECTOR, ".two-pane-serp-page__results-list li")
+            card_count = self.driver.execute_script(
+                "const count = document.querySelectorAll(arguments[0]).length;"
+                "window.scrollTo(0, document.body.scrollHeight);"
+                "return count;", card_locator[1])
+
+            # Wait until the scroll has loaded more jobs. There may be none to load, so
+            # this waits less than a page load before giving up
+            self.readiness.wait_for(self.driver,
+                                    element_count_increases(card_locator, card_count),
+                                    "load_more_jobs",
+                                    timeout=self.config.get('Readiness', {}).get(
+                                        'load_more_timeout', 3),
+                                    fallback=False)
+
+            self.cache_page(self.url)
+
+            # Read every link in the list, we need to remove the company links
+            job_links = self.job_links(self.landing_spec.extract(self.driver)['links'])
+
+            # Don't visit jobs that are in the database, by url or by job id
+            return self.seen_index.filter_new(job_links, self.posting_id_from_url)
 
         except Exception as e:
             print("Unable to properly fetch job list due to error {}.".format(e),
@@ -183,65 +515,122 @@ class LinkedInScraper(BaseScraper):
         Navigate and extract relevant information out of the job posting
         """
         try:
-            self.navigate(url)
-
-            posting_information = {'posting_url': url}
-
-            # Get the job id
-            pattern = r"-([\d]+)\?"
-            posting_information['posting_id'] = re.search(pattern, url).group(1)
-
-            # Get the title
-            title = self.driver.find_element(By.TAG_NAME, 'h1')
-
-            # This will occur if we've hit an auth issue
-            if title.text == 'Join LinkedIn':
-                posting_information.update(
-                    {'job_title': None,
-                     'description': None,
-                     'experience': None,
-                     'employment_type': None,
-                     'industries': None
-                     })
-                return posting_information
-            posting_information['job_title'] = title.text
-
-            # Get the description of the posting
-            posting_description = self.driver.find_element(By.CLASS_NAME,
-                                                           "decorated-job-posting__details")
-            posting_information['description'] = posting_description.text
-
-            # Get the job tags
-            tags = self.driver.find_element(By.CLASS_NAME,
-                                            "description__job-criteria-list")
-
-            # Need to do some handling on these tags to extract information
-            tags = tags.text
-            experience = re.search("Seniority level\n(.*?)\nEmployment",
-                                   tags, re.DOTALL)
-            posting_information['experience'] = experience.group(1) if experience else None
-            employment_type = re.search("Employment type\n(.*?)\nJob function",
-                                        tags, re.DOTALL)
-            posting_information['employment_type'] = employment_type.group(1) if employment_type \
-                else None
-            industries = re.search("Industries\n(.*?)",
-                                   tags, re.DOTALL)
-            posting_information['industries'] = industries.group(1) if industries else None
+            # The title, description and tags come back in the same call as the page check
+            self.navigate(url, self.detail_ready_locator, "detail", spec=self.detail_spec)
+            self.cache_page(url)
+
+            fields = self.page_fields
+            posting_information = self.build_posting_information(url, fields['job_title'],
+                                                                 fields['description'],
+                                                                 fields['criteria'])
+        except Exception as e:
+            posting_information = self.empty_posting_information(url)
+
+        return posting_information
+
+    def posting_id_from_url(self, url):
+        """Get the job id at the end of a LinkedIn posting url."""
+        job_id = LINKEDIN_ID_PATTERN.search(url)
+        return job_id.group(1) if job_id else None
+
+    def parse_job_html(self, url, html):
+        """
+        Extract relevant information out of a job posting page fetched without the browser
+        """
+        try:
+            if html is None:
+                raise ValueError("No page was fetched for {}".format(url))
+
+            fields = parse_element_text(html, self.detail_targets)
+            posting_information = self.build_posting_information(url, fields['job_title'],
+                                                                 fields['description'],
+                                                                 fields['criteria'])
         except Exception as e:
-            posting_information = {'posting_url': url,
-                                   'posting_id': None,
-                                   'job_title': None,
-                                   'description': None,
-                                   'experience': None,
-                                   'employment_type': None,
-                                   'industries': None
-                                   }
+            posting_information = self.empty_posting_information(url)
+
+        return posting_information
+
+    def build_posting_information(self, url, title, description, tags):
+        """
+        Turn the text read off a job posting into our posting dict
+        """
+        posting_information = {'posting_url': url}
+
+        # Get the job id
+        posting_information['posting_id'] = LINKEDIN_QUERY_ID_PATTERN.search(url).group(1)
+
+        # This will occur if we've hit an auth issue
+        if title == 'Join LinkedIn':
+            posting_information.update(
+                {'job_title': None,
+                 'description': None,
+                 'experience': None,
+                 'employment_type': None,
+                 'industries': None
+                 })
+            return posting_information
+
+        if title is None or description is None or tags is None:
+            raise ValueError("Posting {} is missing its title, description or tags".format(url))
+
+        posting_information['job_title'] = title
+        posting_information['description'] = description
+
+        # Need to do some handling on these tags to extract information
+        experience = SENIORITY_PATTERN.search(tags)
+        posting_information['experience'] = experience.group(1) if experience else None
+        employment_type = EMPLOYMENT_TYPE_PATTERN.search(tags)
+        posting_information['employment_type'] = employment_type.group(1) if employment_type \
+            else None
+        industries = INDUSTRIES_PATTERN.search(tags)
+        posting_information['industries'] = industries.group(1) if industries else None
 
         return posting_information
 
+    def empty_posting_information(self, url):
+        """Posting dict for a page we could not parse."""
+        return {'posting_url': url,
+                'posting_id': None,
+                'job_title': None,
+                'description': None,
+                'experience': None,
+                'employment_type': None,
+                'industries': None
+                }
+
 
 class DiceScraper(BaseScraper):
 
+    landing_ready_locator = (By.XPATH, "//div[@data-testid='job-search-results-container']")
+    detail_ready_locator = (By.ID, "jobDescription")
+    job_link_marker = "job-detail"
+
+    landing_spec = ExtractionSpec({
+        'html': {'selector': "[data-testid='job-search-results-container']",
+                 'property': 'innerHTML', 'strip': False},
+        'links': {'selector': "[data-testid='job-search-results-container'] a[href]",
+                  'attribute': 'href', 'all': True},
+        'next_disabled': {'selector': "span[aria-label='Next']", 'attribute': 'aria-disabled'}})
+    detail_spec = ExtractionSpec({
+        'job_title': {'selector': 'h1'},
+        'description': {'selector': '#jobDescription'}})
+
+    # Elements read off a posting page when fetched without the browser
+    detail_targets = {'job_title': ('h1', None, None),
+                      'description': (None, 'id', 'jobDescription')}
+
+    def page_blocked(self, label, status, fields=None):
+        """Posting pages without a title mean Dice didn't serve us the posting."""
+        if super().page_blocked(label, status, fields):
+            return True
+        if label != "detail":
+            return False
+
+        if fields is not None:
+            return not fields['job_title']
+        titles = self.driver.find_elements(By.TAG_NAME, 'h1')
+        return not titles or not titles[0].text.strip()
+
     def handle_landing_popups(self):
         """
         Method for navigating to the search page and handling popups
@@ -261,72 +650,97 @@ class DiceScraper(BaseScraper):
     def extract_jobs_list(self):
         """Method for getting the list of hrefs from the job list"""
         # Loop until we have reached every page
-        current_job_links = self.db_handler.fetch_recent_jobs()
-
-        if type(current_job_links) is None or current_job_links.shape[0] == 0:
-            current_job_links = pd.DataFrame(data={"posting_url": []})
-
         new_links = []
+        job_html = None
+        page = 0
+
+        # Results are newest first, so once pages only show postings we know we can stop
+        watermark_config = self.config.get('Watermark', {})
+        use_watermark = watermark_config.get('enabled', False)
+        overscan = watermark_config.get('overscan', 1)
+        landing_url = self.url
+        watermark = set(self.db_handler.fetch_watermark(landing_url)) if use_watermark else set()
+        newest_ids = []
+        stale_pages = 0
 
         try:
             while True:
-                time.sleep(2)
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                job_list = self.driver.find_element(By.XPATH,
-                                                    "//div[@data-testid='job-search-results-container']"
-                                                    )
+                page += 1
 
-                # Extract the inner html
-                job_html = job_list.get_attribute("innerHTML")
+                # Wait for the next page of results to render over the previous one
+                if job_html is not None:
+                    self.readiness.wait_for(self.driver,
+                                            inner_html_changes(self.landing_ready_locator,
+                                                               job_html),
+                                            "results_page")
 
-                # Regex search for the hrefs
-                href_pattern = r'href=["\'](.*?)["\']'
-                job_links = re.findall(href_pattern, job_html)
+                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                self.cache_page(self.results_page_key(self.url, page))
+
+                # Read the results, their links and whether there's another page at once
+                results = self.landing_spec.extract(self.driver)
+                if results['html'] is None:
+                    raise NoSuchElementException("Results container is missing")
+                job_html = results['html']
 
                 # Add the new links
-                new_links.extend([job for job in job_links
-                                 if job not in current_job_links['posting_url']
-                                 and 'job-detail' in job
-                                  ])
+                page_links = self.job_links(results['links'])
+                new_links.extend(page_links)
+
+                if use_watermark:
+                    page_ids = [canonicalize_id(self.posting_id_from_url(link))
+                                for link in page_links]
+                    if page == 1:
+                        newest_ids = [posting_id for posting_id in dict.fromkeys(page_ids)
+                                      if posting_id is not None]
+                        newest_ids = newest_ids[:watermark_config.get('size', 10)]
+
+                    # Past last run's newest postings everything further down is older
+                    fresh = [link for link, posting_id in zip(page_links, page_ids)
+                             if posting_id not in watermark]
+                    fresh = self.seen_index.filter_new(fresh, self.posting_id_from_url)
+                    reached_watermark = any(posting_id in watermark for posting_id in page_ids)
+
+                    stale_pages = stale_pages + 1 if reached_watermark or not fresh else 0
+                    if stale_pages > overscan:
+                        print("Stopping {} after page {}, only known postings remain".format(
+                            landing_url, page))
+                        break
 
                 # Check to see if we have more pages
-                svg_element = self.driver.find_element(By.XPATH, "//span[@aria-label='Next']")
-                if svg_element.get_attribute('aria-disabled'):
+                if results['next_disabled']:
                     break
                 else:
+                    svg_element = self.driver.find_element(By.XPATH, "//span[@aria-label='Next']")
                     self.handle_landing_popups()
                     self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth'"
                                                ", block: 'center'});", svg_element)
                     svg_element.click()
 
+            # Only a search we got through moves the watermark, once its postings are stored
+            if newest_ids:
+                self.pending_watermark = (landing_url, newest_ids)
+
         except Exception as e:
             print("Could not continue to search for jobs due to error {}".format(e.__class__))
 
         finally:
-            # Get the unique links
-            new_links = list(set(new_links))
-            return new_links
+            # Get the unique links we don't have yet
+            return self.seen_index.filter_new(new_links, self.posting_id_from_url)
 
     def extract_job_information(self, url):
         # Get the url and id
-        posting_information = {'posting_url': url,
-                               'posting_id': url.split('job-detail/')[1],
-                               'job_title': None,
-                               'description': None,
-                               'experience': 'Dice: not available',
-                               'employment_type': 'Dice: not available',
-                               'industries': 'Dice: not available'}
+        posting_information = self.empty_posting_information(url)
 
         try:
-            self.navigate(url)
+            # The title and description come back in the same call as the page check
+            self.navigate(url, self.detail_ready_locator, "detail", spec=self.detail_spec)
+            self.cache_page(url)
 
-            # Get the title
-            title = self.driver.find_element(By.TAG_NAME, 'h1')
-            posting_information['job_title'] = title.text
-
-            # Get the description
-            description = self.driver.find_element(By.ID, "jobDescription")
-            posting_information['description'] = description.text
+            if self.page_fields['description'] is None:
+                raise NoSuchElementException("Posting has no job description")
+            posting_information['job_title'] = self.page_fields['job_title']
+            posting_information['description'] = self.page_fields['description']
 
         except Exception as e:
             print("Could not properly parse url {} due to error: {}".format(url, e))
@@ -334,6 +748,47 @@ class DiceScraper(BaseScraper):
         finally:
             return posting_information
 
+    def results_page_key(self, landing_url, page):
+        """Cache key for one page of a landing page's paginated results."""
+        return "{}#page={}".format(landing_url, page)
+
+    def cached_landing_pages(self, landing_url):
+        """Get the cached html of every page of results we clicked through."""
+        pages = []
+        while True:
+            html = self.page_cache.latest(self.results_page_key(landing_url, len(pages) + 1))
+            if html is None:
+                return pages
+            pages.append(html)
+
+    def posting_id_from_url(self, url):
+        """Get the job id that follows job-detail/ in a Dice posting url."""
+        return url.split('job-detail/')[1] if 'job-detail/' in url else None
+
+    def parse_job_html(self, url, html):
+        """Extract the title and description out of a page fetched without the browser."""
+        posting_information = self.empty_posting_information(url)
+
+        if html is None:
+            print("Could not properly parse url {} due to error: no page fetched".format(url))
+            return posting_information
+
+        fields = parse_element_text(html, self.detail_targets)
+        posting_information['job_title'] = fields['job_title']
+        posting_information['description'] = fields['description']
+
+        return posting_information
+
+    def empty_posting_information(self, url):
+        """Posting dict with only what we know from the url."""
+        return {'posting_url': url,
+                'posting_id': url.split('job-detail/')[1],
+                'job_title': None,
+                'description': None,
+                'experience': 'Dice: not available',
+                'employment_type': 'Dice: not available',
+                'industries': 'Dice: not available'}
+
 
 if __name__ == '__main__':
     from main import load_config
@@ -344,5 +799,6 @@ if __name__ == '__main__':
         config=config
     )
     scraper.extract_all_for_search(config['LandingPages'][0])
-    data = scraper.parse_all_searches()
+    job_count = scraper.parse_all_searches()
+    print("Extracted {} jobs".format(job_count))
     scraper.close()
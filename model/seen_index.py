@@ -0,0 +1,253 @@
+from model.change_feed import has_change_feed
+from urllib.parse import urlsplit, urlunsplit
+import hashlib
+import math
+import os
+import threading
+import time
+
+
+def canonicalize_url(url):
+    """Normalize a posting url so tracking parameters don't make it look new."""
+    if not isinstance(url, str):
+        return None
+
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, "", ""))
+
+
+def canonicalize_id(posting_id):
+    """Normalize a posting id, dropping any query string that came along with it."""
+    if posting_id is None:
+        return None
+    posting_id = str(posting_id).split("?")[0].strip().rstrip("/")
+    return posting_id or None
+
+
+class BloomFilter:
+    """Fixed size bloom filter that can be saved to and loaded from disk."""
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        """
+        :param capacity: Number of keys the filter is sized for.
+        :param error_rate: False positive rate once the filter holds capacity keys.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return [(first + idx * second) % self.num_bits for idx in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8))
+                   for position in self._positions(key))
+
+    def save(self, path):
+        """Write the filter to disk, replacing the old file atomically."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(self.num_bits.to_bytes(8, "big"))
+            file.write(self.num_hashes.to_bytes(2, "big"))
+            file.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, capacity=1000000, error_rate=0.001):
+        """Read a filter from disk, or start a new one if there is none."""
+        bloom = cls(capacity, error_rate)
+        if not os.path.exists(path):
+            return bloom
+
+        with open(path, "rb") as file:
+            num_bits = int.from_bytes(file.read(8), "big")
+            num_hashes = int.from_bytes(file.read(2), "big")
+            bits = bytearray(file.read())
+
+        # A filter saved with other sizing can't be reused
+        if len(bits) != (num_bits + 7) // 8:
+            print("Ignoring malformed bloom filter at {}".format(path))
+            return bloom
+
+        bloom.num_bits, bloom.num_hashes, bloom.bits = num_bits, num_hashes, bits
+        return bloom
+
+
+class SeenPostingsIndex:
+    """
+    Set of postings we already have, keyed by canonical url and posting id, so the
+    scrapers can skip detail pages in O(links) without reading job_postings each page.
+    Keys older than the hydration window can be kept in a bloom filter on disk.
+    """
+
+    def __init__(self, db_handler, days=1, bloom_path=None, bloom_capacity=1000000,
+                 bloom_error_rate=0.001):
+        """
+        :param db_handler: Database the index is hydrated from.
+        :param days: How many days of postings to load from the database.
+        :param bloom_path: File to persist a bloom filter of every key to, None disables it.
+        :param bloom_capacity: Number of keys the bloom filter is sized for.
+        :param bloom_error_rate: False positive rate of the bloom filter.
+        """
+        self.db_handler = db_handler
+        self.days = days
+        self.bloom_path = bloom_path
+
+        self.lock = threading.Lock()
+        self.urls = set()
+        self.ids = set()
+
+        # Postings a scraper is about to visit in this run. Never persisted, so a posting
+        # that isn't stored in the end is tried again next run
+        self.claimed_urls = set()
+        self.claimed_ids = set()
+        self.bloom = BloomFilter.load(bloom_path, bloom_capacity, bloom_error_rate) \
+            if bloom_path else None
+
+        # Change feed position of the last load, None when the database has no feed
+        self.token = None
+        self.loaded_at = None
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Bring the keys up to date with the database. Until the hydration window has
+        passed since the last full load only the postings changed since are read, then
+        the window is reloaded so old keys drop out. Claims of the last run are dropped.
+        """
+        with self.lock:
+            self.claimed_urls, self.claimed_ids = set(), set()
+
+        if self.token is not None and time.monotonic() - self.loaded_at < self.days * 86400:
+            self.apply_changes()
+        else:
+            self.reload()
+
+    def apply_changes(self, batch_size=10000):
+        """Add the keys of postings stored with a description since the last refresh."""
+        while True:
+            changes, self.token = self.db_handler.changes_since(
+                self.token, ["posting_url", "posting_id", "description_hash"], batch_size)
+            # Postings stored without one are scraped again, like the writer leaves them
+            described = changes[changes["description_hash"].notna()]
+            for posting_url, posting_id, _ in described.itertuples(index=False):
+                self.add(posting_url, posting_id)
+            if len(changes) < batch_size:
+                return
+
+    def reload(self):
+        """Reload the keys of recent postings from the database."""
+        # Taken first, postings stored during the load come again with the next refresh
+        token = self.db_handler.change_token() if has_change_feed(
+            self.db_handler, "the seen index reloads recent postings every refresh") else None
+
+        keys = self.db_handler.fetch_recent_posting_keys(self.days)
+
+        urls, ids = set(), set()
+        for posting_url, posting_id in keys:
+            urls.add(canonicalize_url(posting_url))
+            ids.add(canonicalize_id(posting_id))
+        urls.discard(None)
+        ids.discard(None)
+
+        with self.lock:
+            self.urls, self.ids = urls, ids
+            if self.bloom is not None:
+                for key in urls:
+                    self.bloom.add("url:" + key)
+                for key in ids:
+                    self.bloom.add("id:" + key)
+            self.token, self.loaded_at = token, time.monotonic()
+
+    def _seen(self, url, posting_id):
+        if url in self.urls or posting_id in self.ids or url in self.claimed_urls \
+                or posting_id in self.claimed_ids:
+            return True
+        if self.bloom is not None:
+            return (url is not None and "url:" + url in self.bloom) \
+                or (posting_id is not None and "id:" + posting_id in self.bloom)
+        return False
+
+    def is_seen(self, url, posting_id=None):
+        """Check if we already have the posting."""
+        url, posting_id = canonicalize_url(url), canonicalize_id(posting_id)
+        with self.lock:
+            return self._seen(url, posting_id)
+
+    def filter_new(self, links, id_getter=None):
+        """
+        Keep the links we don't have yet, dropping repeats of the same posting.
+        :param links: Posting urls in the order they were found.
+        :param id_getter: Function getting the posting id out of a url.
+        """
+        new_links = []
+        batch_urls, batch_ids = set(), set()
+
+        with self.lock:
+            for link in links:
+                url = canonicalize_url(link)
+                posting_id = canonicalize_id(id_getter(link)) if id_getter else None
+
+                if url is None or url in batch_urls or posting_id in batch_ids \
+                        or self._seen(url, posting_id):
+                    continue
+
+                batch_urls.add(url)
+                if posting_id is not None:
+                    batch_ids.add(posting_id)
+                new_links.append(link)
+
+        return new_links
+
+    def claim(self, url, posting_id=None):
+        """Record a posting we are about to visit, so no other scraper visits it this run."""
+        url, posting_id = canonicalize_url(url), canonicalize_id(posting_id)
+        with self.lock:
+            if url is not None:
+                self.claimed_urls.add(url)
+            if posting_id is not None:
+                self.claimed_ids.add(posting_id)
+
+    def add(self, url, posting_id=None):
+        """Record a posting that has been stored."""
+        url, posting_id = canonicalize_url(url), canonicalize_id(posting_id)
+        with self.lock:
+            if url is not None:
+                self.urls.add(url)
+                if self.bloom is not None:
+                    self.bloom.add("url:" + url)
+            if posting_id is not None:
+                self.ids.add(posting_id)
+                if self.bloom is not None:
+                    self.bloom.add("id:" + posting_id)
+
+    def save(self):
+        """Persist the bloom filter, if we keep one."""
+        if self.bloom is not None:
+            with self.lock:
+                self.bloom.save(self.bloom_path)
+
+
+# One index per database so every scraper class shares what has been seen
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_seen_index(db_handler, **index_config):
+    """Get the shared seen postings index for a database, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(db_handler.db_path)
+        if index is None:
+            index = SeenPostingsIndex(db_handler, **index_config)
+            _indexes[db_handler.db_path] = index
+        return index
@@ -0,0 +1,113 @@
+from model.DataBaseHandler import DataBaseHandler
+from model.database import open_database
+from model.job_writer import JobWriter
+from model.seen_index import SeenPostingsIndex
+from model.driver_watchdog import get_driver_watchdog
+from model import scraper as scraper_module
+import datetime
+import multiprocessing
+import os
+import socket
+import traceback
+
+
+def default_run_id():
+    """Run id shared by every host that starts scraping in the same scheduled minute."""
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M")
+
+
+def shard_worker(db_path, config, run_id, worker, progress_every=10):
+    """
+    Claim and scrape landing page shards until the run has none left. Runs in its own
+    process with its own drivers, so a crashing shard can't take the others down.
+    """
+    db_handler = open_database(config, db_path)
+    sharding = config['scraper_config'].get('Sharding', {})
+    seen_index = SeenPostingsIndex(db_handler, **config['scraper_config'].get('SeenIndex', {}))
+    writer = JobWriter(db_handler, seen_index=seen_index,
+                       **config['scraper_config'].get('JobWriter', {}))
+    get_driver_watchdog(**config['scraper_config'].get('DriverWatchdog', {}))
+
+    # Keep one scraper per class so consecutive shards reuse the same warm browser
+    scrapers = {}
+
+    try:
+        while True:
+            shard = db_handler.claim_shard(run_id, worker,
+                                           max_attempts=sharding.get('max_attempts', 2),
+                                           stale_minutes=sharding.get('stale_minutes', 30))
+            if shard is None:
+                break
+
+            scraper_name = shard['scraper_name']
+            postings = [0]
+
+            def progress(count):
+                postings[0] = count
+                if count % progress_every == 0:
+                    db_handler.update_shard_progress(shard['id'], count)
+
+            try:
+                if scraper_name not in scrapers:
+                    scraper_class = getattr(scraper_module, scraper_name)
+                    scrapers[scraper_name] = scraper_class(
+                        db_handler, config['scraper_config']['classes'][scraper_name],
+                        seen_index=seen_index)
+
+                scrapers[scraper_name].parse_search(shard['landing_url'], writer,
+                                                    progress=progress)
+                db_handler.finish_shard(shard['id'], 'done', postings[0])
+
+            except Exception as e:
+                print("Shard {} failed on {}: {}".format(shard['id'], worker, e))
+                db_handler.finish_shard(shard['id'], 'failed', postings[0],
+                                        error=traceback.format_exc(limit=5))
+
+                # The browser may be in a bad state, start the next shard on a fresh one
+                broken = scrapers.pop(scraper_name, None)
+                if broken is not None:
+                    broken.close()
+
+    finally:
+        for shard_scraper in scrapers.values():
+            shard_scraper.close()
+        writer.close()
+        seen_index.save()
+
+
+def run_sharded_scrapers(config: dict, db_handler: DataBaseHandler, run_id=None):
+    """
+    Split every scraper class's landing pages into shards in the database and work
+    through them with a pool of processes. Other hosts sharing the database and using
+    the same run id pick up shards from the same table.
+    """
+    sharding = config['scraper_config'].get('Sharding', {})
+    run_id = run_id or default_run_id()
+
+    shards = [(scraper_name, landing_url)
+              for scraper_name, scraper_config in config['scraper_config']['classes'].items()
+              for landing_url in scraper_config.get('LandingPages', [])]
+    db_handler.enqueue_shards(run_id, shards)
+
+    # Spawn rather than fork, chrome and our threads don't survive a fork
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    workers = ["{}-{}-{}".format(host, os.getpid(), idx)
+               for idx in range(sharding.get('processes', 2))]
+
+    processes = [context.Process(target=shard_worker,
+                                 args=(db_handler.db_path, config, run_id, worker))
+                 for worker in workers]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # Anything a crashed worker was holding is marked failed so it can be retried
+    db_handler.fail_abandoned_shards(run_id, workers)
+
+    progress = db_handler.fetch_shards(run_id)
+    print("Sharded run {} finished: {}".format(run_id,
+                                               progress['status'].value_counts().to_dict()))
+
+    return progress
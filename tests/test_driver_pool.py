@@ -0,0 +1,79 @@
+from model.driver_pool import DriverPool
+import threading
+
+
+class FakeDriver:
+    """Stands in for a chrome driver, the pool only needs it to answer current_url."""
+    current_url = "about:blank"
+
+    def get(self, url):
+        pass
+
+
+class FakeDriverPool(DriverPool):
+    """Pool that hands out fake drivers instead of launching chrome."""
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.quit = []
+
+    def _create_driver(self):
+        driver = FakeDriver()
+        self.page_loads[driver] = 0
+        return driver
+
+    def _quit_driver(self, driver):
+        self.page_loads.pop(driver, None)
+        self.flagged.discard(driver)
+        self.quit.append(driver)
+
+
+def lease_in_dead_thread(pool):
+    """Lease a driver from a thread that exits without returning it."""
+    leased = []
+    thread = threading.Thread(target=lambda: leased.append(pool.lease()))
+    thread.start()
+    thread.join()
+    return leased[0]
+
+
+def test_recycle_keeps_the_slot():
+    pool = FakeDriverPool(size=1)
+    driver = pool.lease()
+
+    fresh = pool.recycle(driver)
+
+    assert fresh is not driver
+    assert pool.quit == [driver]
+    assert pool.leased == 1
+    pool.release(fresh)
+    assert pool.leased == 0
+
+
+def test_reap_then_recycle():
+    pool = FakeDriverPool(size=1, lease_timeout=0)
+    driver = lease_in_dead_thread(pool)
+
+    assert pool.reap_orphans() == 1
+    assert pool.leased == 0
+
+    # The reaped driver's slot was already freed, recycling leases a new one
+    fresh = pool.recycle(driver)
+    assert fresh is not driver
+    assert pool.quit == [driver]
+    assert pool.leased == 1
+    assert pool.owners[fresh] is threading.current_thread()
+
+    pool.release(fresh)
+    assert pool.leased == 0
+    assert pool.idle == [fresh]
+
+
+def test_reap_then_release():
+    pool = FakeDriverPool(size=1)
+    driver = lease_in_dead_thread(pool)
+    pool.reap_orphans()
+
+    pool.release(driver)
+    assert pool.leased == 0
+    assert pool.idle == []
@@ -0,0 +1,39 @@
+from benchmark.query_plans import fill_job_postings
+from model.DataBaseHandler import DataBaseHandler
+import pytest
+
+
+@pytest.fixture
+def db_handler(tmp_path):
+    db_handler = DataBaseHandler(str(tmp_path / "jobs.db"))
+    fill_job_postings(db_handler, 2000)
+    yield db_handler
+    db_handler.close()
+
+
+def test_export_writes_each_change_once(db_handler, tmp_path):
+    snapshot_dir = str(tmp_path / "job_snapshot")
+    assert db_handler.export_snapshot(snapshot_dir) == 2000
+    assert db_handler.export_snapshot(snapshot_dir) == 0
+
+    # All in the same second, which updated_at could not tell apart
+    db_handler.update_applied_status([(job_id, True) for job_id in range(1, 2001, 20)])
+    assert db_handler.export_snapshot(snapshot_dir) == 100
+    assert db_handler.export_snapshot(snapshot_dir) == 0
+
+
+def test_deletions_leave_the_snapshot(db_handler, tmp_path):
+    snapshot_dir = str(tmp_path / "job_snapshot")
+    db_handler.export_snapshot(snapshot_dir)
+
+    db_handler.delete_jobs([2, 3])
+    assert db_handler.export_snapshot(snapshot_dir) == 0
+    data = db_handler.fetch_jobs_snapshot(["id"], snapshot_dir, catch_up=False)
+    assert len(data) == 1998 and not data["id"].isin([2, 3]).any()
+
+    # Caught up from the change feed before the next export
+    db_handler.delete_jobs([4])
+    db_handler.update_applied_status([(5, True)])
+    data = db_handler.fetch_jobs_snapshot(["id", "applied"], snapshot_dir)
+    assert len(data) == 1997
+    assert data.set_index("id").loc[5, "applied"] == 1
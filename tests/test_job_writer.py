@@ -0,0 +1,63 @@
+from model.DataBaseHandler import DataBaseHandler
+from model.db_writer import DatabaseWriter
+from model.job_writer import JobWriter
+from model.seen_index import SeenPostingsIndex
+import sqlite3
+import pytest
+
+
+def posting(idx, **fields):
+    return dict({"posting_url": "https://example.com/jobs/view/{}".format(idx),
+                 "posting_id": str(idx), "job_title": "Data Scientist",
+                 "description": "Description {}".format(idx), "experience": None,
+                 "employment_type": None, "industries": None}, **fields)
+
+
+@pytest.fixture
+def db_handler(tmp_path):
+    db_handler = DataBaseHandler(str(tmp_path / "jobs.db"))
+    yield db_handler
+    db_handler.close()
+
+
+def test_bad_posting_only_drops_itself(db_handler):
+    db_handler.insert_jobs([posting(0)])
+    seen_index = SeenPostingsIndex(db_handler)
+    writer = JobWriter(db_handler, batch_size=10, seen_index=seen_index)
+
+    # No posting id to upsert on and a url we already have breaks the unique posting_url
+    duplicate = posting(0, posting_id=None)
+    futures = [writer.put(posting(idx)) for idx in range(1, 5)]
+    futures.insert(2, writer.put(duplicate))
+    futures += [writer.put(posting(idx)) for idx in range(5, 10)]
+    writer.close()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result()
+    assert all(future.result() for future in futures[:2] + futures[3:])
+    assert (writer.written, writer.failed) == (9, 1)
+    assert len(db_handler.fetch_all_jobs(["id"])) == 10
+    assert seen_index.is_seen(posting(9)["posting_url"])
+
+
+def test_failed_commit_fails_every_request(tmp_path):
+    path = str(tmp_path / "writes.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE parent (id INTEGER PRIMARY KEY);
+        CREATE TABLE child (parent_id INTEGER REFERENCES parent (id)
+                            DEFERRABLE INITIALLY DEFERRED);
+    """)
+    conn.close()
+
+    # The deferred foreign key is only checked, and only fails, at COMMIT
+    writer = DatabaseWriter(path, flush_interval=0.5)
+    futures = [writer.submit([("INSERT INTO child VALUES (?)", [(1,)])]),
+               writer.submit([("INSERT INTO parent VALUES (?)", [(2,)])])]
+    for future in futures:
+        with pytest.raises(sqlite3.IntegrityError):
+            future.result()
+
+    # The failed transaction was rolled back, so the writer keeps going
+    assert writer.execute([("INSERT INTO parent VALUES (?)", [(3,)])]) == [1]
+    writer.close()
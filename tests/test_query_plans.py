@@ -0,0 +1,25 @@
+from benchmark.query_plans import (HOT_QUERIES, check_query_plan, fill_job_postings,
+                                   full_scans, query_plan)
+from model.DataBaseHandler import DataBaseHandler
+import pytest
+
+
+@pytest.fixture(scope="module")
+def db_handler(tmp_path_factory):
+    db_handler = DataBaseHandler(str(tmp_path_factory.mktemp("plans") / "plans.db"))
+    fill_job_postings(db_handler, 20000)
+    yield db_handler
+    db_handler.close()
+
+
+# In order, delete_jobs has to run last
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_its_index(db_handler, name):
+    plan, ok = check_query_plan(db_handler, name)
+    assert ok, "{} plan: {}".format(name, " | ".join(plan))
+
+
+def test_full_scan_is_caught(db_handler):
+    conn = db_handler.get_connection()
+    plan = query_plan(conn, "SELECT id FROM job_postings WHERE job_title = 'Data Scientist'")
+    assert full_scans(conn, plan) == ["SCAN job_postings"]
@@ -0,0 +1,57 @@
+from benchmark.query_plans import fill_job_postings
+from model.DataBaseHandler import DataBaseHandler
+import sqlite3
+import pytest
+
+
+class RecordingHandler(DataBaseHandler):
+    """Notes the maintenance retention asks for."""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.maintenance = []
+
+    def reclaim_space(self, pages=0, convert=False):
+        self.maintenance.append("reclaim_space")
+        super().reclaim_space(pages, convert)
+
+    def analyze(self, analysis_limit=1000):
+        self.maintenance.append("analyze")
+        super().analyze(analysis_limit)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    return str(tmp_path / "archive.db")
+
+
+def test_nothing_expired_skips_maintenance(tmp_path, archive_path):
+    db_handler = RecordingHandler(str(tmp_path / "jobs.db"))
+    fill_job_postings(db_handler, 200)
+
+    report = db_handler.apply_retention(days=10000, archive_path=archive_path)
+    assert report["archived"] == 0
+    assert db_handler.maintenance == []
+    assert "read_seconds_before" not in report
+    db_handler.close()
+
+
+def test_old_database_is_only_converted_on_request(tmp_path, archive_path):
+    # Created without incremental auto vacuum, like databases from before it was turned on
+    path = str(tmp_path / "jobs.db")
+    sqlite3.connect(path).execute("CREATE TABLE created_before (id INTEGER)").connection.close()
+    db_handler = DataBaseHandler(path)
+    fill_job_postings(db_handler, 200)
+
+    def auto_vacuum():
+        return db_handler.get_connection().execute("PRAGMA auto_vacuum").fetchone()[0]
+
+    # Half of them were applied to and kept for the second run
+    db_handler.update_applied_status([(job_id, True) for job_id in range(1, 201, 2)])
+    report = db_handler.apply_retention(days=0, archive_path=archive_path)
+    assert report["archived"] == 100 and auto_vacuum() == 0
+
+    report = db_handler.apply_retention(days=0, keep_applied=False, archive_path=archive_path,
+                                        convert_auto_vacuum=True)
+    assert report["archived"] == 100 and auto_vacuum() == 2
+    db_handler.close()
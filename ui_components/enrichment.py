@@ -2,7 +2,7 @@ import streamlit as st
 import json
 import os
 import time
-from model.DataBaseHandler import DataBaseHandler
+from model.database import open_database
 from model.data_enrichment import load_config, eval_on_loop, run_scrapers, process_unprocessed_jobs
 from ui_components.agent_manger import agent
 import threading
@@ -20,7 +20,7 @@ eval_running_flag = False
 def get_db_handler_and_config():
     """Helper function to initialize and return a DB handler and configuration."""
     config = load_config()
-    db_handler = DataBaseHandler()
+    db_handler = open_database(config)
     return db_handler, config
 
 
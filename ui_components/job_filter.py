@@ -3,7 +3,12 @@ import json
 import pandas as pd
 import os
 import numpy as np
-from model.DataBaseHandler import DataBaseHandler
+from model.DataBaseHandler import DataBaseHandler, SEARCH_COLUMNS
+from model.change_feed import JobChangeFeed
+from model.database import open_database
+from ui_components.config_editor import load_config
+from sqlalchemy.exc import DBAPIError
+import sqlite3
 
 # File for saving queries
 QUERY_FILE = "saved_queries.json"
@@ -25,9 +30,55 @@ def save_query(query_name, active_filters):
         json.dump(saved_queries, file, indent=4)
 
 
+@st.cache_resource
+def cached_database(database_config):
+    """
+    Open the database once per process rather than on every rerun, so every session
+    shares its connections, or with a url its connection pool.
+    :param database_config: database_config section of the config as sorted JSON.
+    """
+    return open_database({'database_config': json.loads(database_config)})
+
+
+def load_answers(field, feed, db_handler):
+    """
+    One column per agent question, pivoted from the agent_results table once per session.
+    After that only the answers of postings the change feed saw change are read again.
+    """
+    if "agent_answers" not in st.session_state:
+        st.session_state.agent_answers = {}
+    cache = st.session_state.agent_answers
+
+    # Answers are cached per field, so every field goes stale with the same postings
+    if feed.changed_ids is None:
+        cache.clear()
+    for answers in cache.values():
+        answers["stale"].update(feed.changed_ids)
+
+    answers = cache.get(field)
+    if answers is None:
+        answers = {"table": db_handler.fetch_agent_results(field), "stale": set()}
+        cache[field] = answers
+    elif answers["stale"]:
+        stale = list(answers["stale"])
+        table = answers["table"]
+        answers["table"] = pd.concat([table[~table.index.isin(stale)],
+                                      db_handler.fetch_agent_results(field, job_ids=stale)])
+        answers["stale"] = set()
+    return answers["table"]
+
+
 def load_data(view_type, db_handler):
     """Load job data based on view selection."""
-    loaded = db_handler.fetch_all_jobs()
+    # The unprocessed view only needs the postings still waiting on the agent
+    if view_type not in ("View Jobs", "Response Explanation"):
+        return db_handler.fetch_unprocessed_jobs()
+
+    # Loaded from the Parquet snapshot once per session, after that each rerun only
+    # reads the postings that changed since the last one
+    if "job_feed" not in st.session_state:
+        st.session_state.job_feed = JobChangeFeed()
+    loaded = st.session_state.job_feed.poll(db_handler)
 
     # Define priority columns and ordering
     ordering = [col for col in ['insert_timestamp', 'job_title', 'applied', 'posting_url', 'job_id']
@@ -35,61 +86,73 @@ def load_data(view_type, db_handler):
     other_cols = [col for col in loaded.columns if col not in ordering]
     loaded = loaded[ordering + other_cols]
 
+    # One column per agent question
+    field = "response" if view_type == "View Jobs" else "explanation"
+    answers = load_answers(field, st.session_state.job_feed, db_handler)
+    loaded = loaded.merge(answers, how="left", left_on="id", right_index=True)
+
     # Convert columns to appropriate types
     if 'applied' in loaded.columns:
         loaded['applied'] = loaded['applied'].astype(bool)
     if 'id' in loaded.columns:
         loaded['id'] = loaded['id'].astype(str)
 
-    # Ensure JSON column is parsed correctly
-    # loaded["agent_response"] = loaded["agent_response"].apply(
-    #    lambda x: json.loads(x) if isinstance(x, str) and pd.notna(x) else {}
-    # )
-
-    loaded["agent_response"] = [json.loads(row) if row is not None else {}
-                                for row in loaded["agent_response"]]
-    if view_type == "View Jobs":
-        json_expanded = loaded["agent_response"].apply(
-            lambda data: {key: data[key]["response"] for key in data if "response" in data[key]})
-    elif view_type == "Response Explanation":
-        json_expanded = loaded["agent_response"].apply(
-            lambda data: {key: data[key]["explanation"] for key in data if "explanation" in data[key]})
-    else:
-        return db_handler.fetch_unprocessed_jobs()
-
-    json_expanded = json_expanded.apply(pd.Series)
-    loaded = pd.concat([loaded.drop(columns=["agent_response"]), json_expanded], axis=1)
-
-    loaded.columns = [col.replace('?', '').replace(' ', '_') if '?' in col else col
-                      for col in loaded.columns]
+    renamed = {col: col.replace('?', '').replace(' ', '_') if '?' in col else col
+               for col in loaded.columns}
+    loaded.columns = [renamed[col] for col in loaded.columns]
     loaded.fillna('Missing Value', inplace=True)
 
+    # Lets the filters look responses up in agent_results instead of scanning the column
+    if field == "response":
+        loaded.attrs['agent_questions'] = {renamed[question]: question
+                                           for question in answers.columns}
+
     return loaded
 
 
-def filter_contains(df, column, value=None):
+def filter_contains(df, column, value=None, db_handler=None):
     """Filter a column using 'Contains' logic."""
     if not value:
         value = st.sidebar.text_input(f"Enter keyword for '{column}'")
     if value:
+        # Titles and descriptions are searched through the full text index
+        if db_handler is not None and column in SEARCH_COLUMNS and 'id' in df.columns:
+            try:
+                matches = {str(job_id) for job_id in db_handler.search_job_ids(value, column)}
+                condition = df['id'].astype(str).isin(matches)
+                return condition, {'func': 'filter_contains', 'value': value}
+            except (sqlite3.OperationalError, DBAPIError) as e:
+                print("Full text search failed, falling back to scanning: {}".format(e))
+
         condition = df[column].str.contains(value, case=False, na=False)
         return condition, {'func': 'filter_contains', 'value': value}
     return None, None
 
 
-def filter_list_search(df, column, selected_values=None):
+def filter_list_search(df, column, selected_values=None, db_handler=None):
     """Filter a column using list selection."""
     if not selected_values:
         column_values = df[column].value_counts()
         selected_values = st.sidebar.multiselect(
             f"Select values for '{column}'", options=column_values.index.tolist())
     if selected_values:
-        condition = df[column].isin(selected_values)
+        # Agent answers are matched on the agent_results index, unanswered postings
+        # have no rows there so those still need the column
+        question = df.attrs.get('agent_questions', {}).get(column)
+        if db_handler is not None and question is not None and 'id' in df.columns \
+                and 'Missing Value' not in selected_values:
+            matches = set()
+            for response in selected_values:
+                matches.update(str(job_id) for job_id in
+                               db_handler.fetch_job_ids_with_response(question, response))
+            condition = df['id'].isin(matches)
+        else:
+            condition = df[column].isin(selected_values)
         return condition, {'func': 'filter_list_search', 'value': selected_values}
     return None, None
 
 
-def filter_slider(df, column, selected_values=None):
+def filter_slider(df, column, selected_values=None, db_handler=None):
     """Filter numerical columns using a slider."""
     if selected_values:
         start_value, end_value = selected_values[0], selected_values[1]
@@ -102,7 +165,7 @@ def filter_slider(df, column, selected_values=None):
     return condition, {'func': 'filter_slider', 'value': [start_value, end_value]}
 
 
-def filter_datetime_slider(df, column, selected_values=None):
+def filter_datetime_slider(df, column, selected_values=None, db_handler=None):
     """Filter datetime columns using date inputs."""
     df[column] = pd.to_datetime(df[column])
     min_date, max_date = df[column].min(), df[column].max()
@@ -114,7 +177,7 @@ def filter_datetime_slider(df, column, selected_values=None):
     return condition, {'func': 'filter_datetime_slider', 'value': None}
 
 
-def filter_boolean(df, column, bool_choice=None):
+def filter_boolean(df, column, bool_choice=None, db_handler=None):
     """Filter Boolean columns using radio buttons."""
     if bool_choice is None:
         bool_choice = st.sidebar.radio(f"Filter '{column}'", ["All", True, False])
@@ -126,9 +189,10 @@ def filter_boolean(df, column, bool_choice=None):
 
 def filter_job_postings(db_handler: DataBaseHandler = None):
     """Streamlit function to filter and view job postings."""
-    # If no DB handler is provided, create one using environment authentication
+    # If no DB handler is provided, use the one the config points at
     if db_handler is None:
-        db_handler = DataBaseHandler()
+        db_handler = cached_database(json.dumps(load_config().get('database_config') or {},
+                                                sort_keys=True))
 
     st.title("Job Postings Viewer")
 
@@ -172,14 +236,15 @@ def filter_job_postings(db_handler: DataBaseHandler = None):
         if saved_col and use_save_data:
             # Evaluate the stored filtering function: note that eval() is used here,
             # so ensure that your saved metadata is trusted.
-            condition, saved_data = eval(saved_col['func'])(df, column, saved_col['value'])
+            condition, saved_data = eval(saved_col['func'])(df, column, saved_col['value'],
+                                                            db_handler=db_handler)
         elif pd.api.types.is_string_dtype(df[column]) or pd.api.types.is_object_dtype(df[column]):
             filter_type = st.sidebar.radio(f"Filter type for '{column}'", [
                                            "List Search", "Contains"], key=column)
             if filter_type == "Contains":
-                condition, saved_data = filter_contains(df, column)
+                condition, saved_data = filter_contains(df, column, db_handler=db_handler)
             else:
-                condition, saved_data = filter_list_search(df, column)
+                condition, saved_data = filter_list_search(df, column, db_handler=db_handler)
         elif pd.api.types.is_bool_dtype(df[column]):
             condition, saved_data = filter_boolean(df, column)
         elif pd.api.types.is_numeric_dtype(df[column]):